@@ -1,15 +1,51 @@
 #!/usr/bin/env python3
 """class BasicAuth."""
 import base64
+import hashlib
+import hmac
+import os
 from .auth import Auth
-from typing import TypeVar
+from .cache import LRUCache
+from typing import List, Tuple, TypeVar
 
+from models import metrics
+from models.metrics import timed
 from models.user import User
 
 
 class BasicAuth(Auth):
     """Implementation of the Basic Authorization method."""
 
+    def __init__(self) -> None:
+        """Set up the verified-credential cache.
+
+        Verified Authorization headers are cached, under a keyed digest,
+        as the user id and the password hash they were checked against.
+        """
+        super().__init__()
+        self.credential_cache = LRUCache(
+            int(os.getenv("AUTH_CACHE_SIZE", "1024")),
+            float(os.getenv("AUTH_CACHE_TTL", "300")))
+        self._cache_key = os.urandom(32)
+        User.subscribe(self._on_user_change)
+        stats = self.credential_cache.stats
+        for stat in stats():
+            metrics.gauge("auth_cache_" + stat,
+                          lambda stat=stat: stats()[stat], cache="credentials")
+
+    def _on_user_change(self, op: str, user: TypeVar('User')) -> None:
+        """Drop cached credentials of a saved or removed user."""
+        if user is None:
+            self.credential_cache.clear()
+        else:
+            self.credential_cache.invalidate_tag(user.id)
+
+    def _credential_digest(self, authorization_header: str) -> bytes:
+        """Keyed digest of an Authorization header, used as cache key."""
+        return hmac.new(self._cache_key, authorization_header.encode('utf-8'),
+                        hashlib.sha256).digest()
+
+    @timed("basic_auth.extract_base64_authorization_header")
     def extract_base64_authorization_header(self,
                                             authorization_header: str) -> str:
         """Extract of Base64."""
@@ -22,6 +58,7 @@ class BasicAuth(Auth):
         token = authorization_header.split(" ")[-1]
         return token
 
+    @timed("basic_auth.decode_base64_authorization_header")
     def decode_base64_authorization_header(self,
                                            base64_authorization_header:
                                            str) -> str:
@@ -37,6 +74,7 @@ class BasicAuth(Auth):
         except Exception:
             return None
 
+    @timed("basic_auth.extract_user_credentials")
     def extract_user_credentials(self,
                                  decoded_base64_authorization_header:
                                  str) -> (str, str):
@@ -54,30 +92,63 @@ class BasicAuth(Auth):
     def user_object_from_credentials(self, user_email: str,
                                      user_pwd: str) -> TypeVar('User'):
         """Retrieve and returns a User instance."""
+        return self._verified_user(user_email, user_pwd)[0]
+
+    @timed("basic_auth.user_object_from_credentials")
+    def _verified_user(self, user_email: str,
+                       user_pwd: str) -> Tuple[TypeVar('User'), str]:
+        """Return the User matching the credentials and the password hash
+        they were checked against, or (None, None)."""
         if user_email is None or not isinstance(user_email, str):
-            return None
+            return None, None
         if user_pwd is None or not isinstance(user_pwd, str):
-            return None
+            return None, None
         try:
             users = User.search({"email": user_email})
             if not users or users == []:
-                return None
+                return None, None
             for u in users:
+                pwd_hash = u.password
                 if u.is_valid_password(user_pwd):
-                    return u
-            return None
+                    return u, pwd_hash
+            return None, None
         except Exception:
-            return None
+            return None, None
+
+    def rate_limit_keys(self, request=None) -> List[str]:
+        """Add the email of the (unverified) credentials to the buckets."""
+        keys = super().rate_limit_keys(request)
+        token = self.extract_base64_authorization_header(
+            self.authorization_header(request))
+        email, pwd = self.extract_user_credentials(
+            self.decode_base64_authorization_header(token))
+        if email is not None:
+            keys.append("email:" + email)
+        return keys
 
+    @timed("basic_auth.current_user")
     def current_user(self, request=None) -> TypeVar('User'):
         """Return a User instance based."""
         Auth_header = self.authorization_header(request)
-        if Auth_header is not None:
-            token = self.extract_base64_authorization_header(Auth_header)
-            if token is not None:
-                decoded = self.decode_base64_authorization_header(token)
-                if decoded is not None:
-                    email, pword = self.extract_user_credentials(decoded)
-                    if email is not None:
-                        return self.user_object_from_credentials(email, pword)
-        return
+        if Auth_header is None:
+            return
+        digest = self._credential_digest(Auth_header)
+        cached = self.credential_cache.get(digest)
+        if cached is not None:
+            user_id, pwd_hash = cached
+            user = User.get(user_id)
+            if user is not None and user.password == pwd_hash:
+                return user
+            self.credential_cache.delete(digest)
+        user, pwd_hash = None, None
+        token = self.extract_base64_authorization_header(Auth_header)
+        if token is not None:
+            decoded = self.decode_base64_authorization_header(token)
+            if decoded is not None:
+                email, pword = self.extract_user_credentials(decoded)
+                if email is not None:
+                    user, pwd_hash = self._verified_user(email, pword)
+        if user is not None:
+            self.credential_cache.set(digest, (user.id, pwd_hash),
+                                      tag=user.id)
+        return user
@@ -2,7 +2,7 @@
 """
 Module of Index views
 """
-from flask import jsonify, abort
+from flask import jsonify, abort, Response
 from api.v1.views import app_views
 
 
@@ -28,6 +28,19 @@ def stats() -> str:
     return jsonify(stats)
 
 
+@app_views.route('/metrics', methods=['GET'], strict_slashes=False)
+def metrics() -> str:
+    """ GET /api/v1/metrics
+    Return:
+      - the timers and counters of the API, in the Prometheus text format
+      - 404 if metrics are disabled (METRICS is not 1)
+    """
+    from models.metrics import METRICS_ENABLED, render
+    if not METRICS_ENABLED:
+        abort(404)
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
 @app_views.route('/unauthorized/', methods=['GET'], strict_slashes=False)
 def unauthorized() -> str:
     """
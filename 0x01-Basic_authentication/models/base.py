@@ -1,37 +1,127 @@
 #!/usr/bin/env python3
 """ Base module
 """
-from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+from typing import Callable, TypeVar, List, Iterable, Iterator, Tuple
+from os import getenv
+import atexit
 import json
+import os
+import tempfile
+import threading
+import time
 import uuid
 
+from models.columns import ColumnStore
+from models.filelock import FileLock
+from models.journal import Journal
+from models.lazy import LazyObjects
+from models.metrics import timed
+from models.serializer import Serializer
+from models.shards import ShardedObjects, shard_of, shard_path
+from models.snapshot import Snapshot
+from models import snapshot
+
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+EPOCH = datetime(1970, 1, 1)
 DATA = {}
+INDEXES = {}
+INDEXED_VALUES = {}
+ORDERED_IDS = {}
+SERIALIZERS = {}
+JOURNALS = {}
+LISTENERS = {}
+LOCKS = {}
+LOCKS_LOCK = threading.Lock()
+WRITERS = {}
+FILE_LOCKS = {}
+FILE_STATES = {}
+DIRTY = {}
+FLUSHERS = {}
+DB_PERSISTENCE = getenv("DB_PERSISTENCE", "file")
+DB_JOURNAL_COMPACT_EVERY = int(getenv("DB_JOURNAL_COMPACT_EVERY", "1000"))
+DB_LAZY_LOAD = getenv("DB_LAZY_LOAD", "0") == "1"
+DB_STORAGE = getenv("DB_STORAGE", "dict")
+DB_MULTIPROCESS = getenv("DB_MULTIPROCESS", "0") == "1"
+DB_WRITE_BEHIND = float(getenv("DB_WRITE_BEHIND", "0"))
+DB_SHARDS = int(getenv("DB_SHARDS", "1"))
+DB_FORMAT = getenv("DB_FORMAT", "json")
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string (or seconds since the epoch, as
+    decoded from binary snapshots)
+    Timestamps written by to_json are fixed-width ISO 8601, which
+    fromisoformat parses much faster than strptime
+    """
+    if type(value) is int:
+        return EPOCH + timedelta(0, value)
+    if len(value) == 19 and value[10] == 'T':
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def file_key(file_path: str) -> Tuple[int, int, int]:
+    """ (inode, modification time, size) of a file, None if it is missing
+    Files are replaced (os.replace) rather than rewritten, so the key
+    changes with every write
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def fingerprint(obj_json: dict) -> int:
+    """ Hash of a JSON dictionary, whatever the order of its keys
+    """
+    try:
+        return hash(frozenset(obj_json.items()))
+    except TypeError:
+        return hash(json.dumps(obj_json, sort_keys=True))
+
+
+def flush_all():
+    """ Write the changes of every class not written yet (write-behind
+    mode), e.g. before the process exits
+    """
+    for cls, event, lock in list(FLUSHERS.values()):
+        cls.flush()
 
 
 class Base():
     """ Base class
     """
 
+    indexed_attributes = ()
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+        if DATA.get(s_class) is None or INDEXES.get(s_class) is None:
+            with self._lock():
+                if DATA.get(s_class) is None:
+                    DATA[s_class] = self.__class__._empty_store()
+                if INDEXES.get(s_class) is None:
+                    self.__class__._reset_indexes()
 
-        self.id = kwargs.get('id', str(uuid.uuid4()))
+        self.id = kwargs['id'] if 'id' in kwargs else str(uuid.uuid4())
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = parse_timestamp(kwargs.get('created_at'))
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = parse_timestamp(kwargs.get('updated_at'))
         else:
             self.updated_at = datetime.utcnow()
 
@@ -44,62 +134,600 @@ class Base():
             return False
         return (self.id == other.id)
 
-    def to_json(self, for_serialization: bool = False) -> dict:
+    def to_json(self, for_serialization: bool = False,
+                fields: Iterable[str] = None) -> dict:
         """ Convert the object a JSON dictionary
+        `fields` restricts the output to the given attributes
         """
-        result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key[0] == '_':
-                continue
-            if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
-            else:
-                result[key] = value
-        return result
+        return self.serializer().to_json(self, for_serialization, fields)
 
     @classmethod
+    def serializer(cls) -> Serializer:
+        """ Serializer of the class
+        """
+        s_class = cls.__name__
+        if SERIALIZERS.get(s_class) is None:
+            SERIALIZERS[s_class] = Serializer(TIMESTAMP_FORMAT)
+        return SERIALIZERS[s_class]
+
+    @classmethod
+    @timed("base.load_from_file")
     def load_from_file(cls):
         """ Load all objects from file
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        with cls._lock(), cls._file_lock():
+            objs_json, keys = cls._read_file()
+            position = (None, 0)
+            if DB_PERSISTENCE == "journal":
+                records, offset, inode = cls._journal().read_from(0)
+                Journal.fold(objs_json, records)
+                position = (inode, offset)
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
+            cls._reset_indexes()
+            DATA[s_class] = cls._build_store(objs_json)
             for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+                cls._index_put(obj_id, obj_json)
+            ORDERED_IDS[s_class] = sorted(DATA[s_class].keys())
+            DIRTY.pop(s_class, None)
+            if DB_MULTIPROCESS:
+                FILE_STATES[s_class] = {
+                    "file": keys, "journal": position,
+                    "seen": {obj_id: fingerprint(obj_json)
+                             for obj_id, obj_json in objs_json.items()}}
+        cls._notify("load", None)
 
     @classmethod
-    def save_to_file(cls):
+    @timed("base.save_to_file")
+    def save_to_file(cls, shards: Iterable[int] = None):
         """ Save all objects to file
+        With DB_SHARDS > 1, only the files of `shards` (all by default)
+        are rewritten. In journal mode, this is a compaction: the journal
+        is folded into the files and truncated
+        """
+        if DB_PERSISTENCE == "journal" and not DB_MULTIPROCESS:
+            cls._journal().snapshot(cls._objs_json, cls._write_file,
+                                    cls._lock())
+        elif DB_PERSISTENCE == "journal":
+            with cls._write_lock():
+                cls._journal().snapshot(cls._objs_json, cls._write_file)
+                cls._written()
+        else:
+            with cls._write_lock():
+                with cls._writer():
+                    cls._write_file(cls._objs_json(shards), shards)
+                cls._written()
+
+    @classmethod
+    def _lock(cls) -> threading.RLock:
+        """ Lock held while the objects of the class are modified
+
+        Only writers (save, remove, load_from_file and the persistence
+        snapshots) take it: get and search read without locking, from
+        copies of the mappings they iterate.
+        """
+        s_class = cls.__name__
+        lock = LOCKS.get(s_class)
+        if lock is None:
+            with LOCKS_LOCK:
+                lock = LOCKS.setdefault(s_class, threading.RLock())
+        return lock
+
+    @classmethod
+    def _writer(cls) -> threading.Lock:
+        """ Lock held from the collection of the objects to write until
+        their files are replaced
+
+        It is taken under the lock of the class and released once the
+        files are written, possibly after the lock of the class: the
+        files are thus replaced in the order the objects were collected,
+        and the most recent state is written last.
+        """
+        s_class = cls.__name__
+        writer = WRITERS.get(s_class)
+        if writer is None:
+            with LOCKS_LOCK:
+                writer = WRITERS.setdefault(s_class, threading.Lock())
+        return writer
+
+    @classmethod
+    def _file_lock(cls) -> FileLock:
+        """ Lock shared with the other processes, held (after the lock of
+        the class) while the files of the class are read and written
+        Only used with DB_MULTIPROCESS=1
+        """
+        if not DB_MULTIPROCESS:
+            return nullcontext()
+        s_class = cls.__name__
+        if FILE_LOCKS.get(s_class) is None:
+            FILE_LOCKS[s_class] = FileLock(".db_{}.lock".format(s_class))
+        return FILE_LOCKS[s_class]
+
+    @classmethod
+    @contextmanager
+    def _write_lock(cls):
+        """ Hold the lock of the class and, with DB_MULTIPROCESS=1, the
+        file lock, after applying the changes written by the other
+        processes, so that they are not overwritten
+        """
+        changes = []
+        with cls._lock(), cls._file_lock():
+            if DB_MULTIPROCESS:
+                changes = cls._refresh_locked()
+            yield
+        for op, obj in changes:
+            cls._notify(op, obj)
+
+    @classmethod
+    def _empty_store(cls) -> dict:
+        """ New empty mapping of the objects of the class
+        """
+        return cls._build_store({})
+
+    @classmethod
+    def _build_store(cls, objs_json: dict) -> dict:
+        """ New mapping of the objects of the class, from their JSON
+        dictionaries
+        With DB_STORAGE=compact, objects are stored column by column, with
+        DB_LAZY_LOAD=1 they are built on first access, and with
+        DB_SHARDS > 1 they are split into DB_SHARDS such mappings
+        """
+        if DB_SHARDS > 1:
+            split = [{} for i in range(DB_SHARDS)]
+            for obj_id, obj_json in objs_json.items():
+                split[shard_of(obj_id, DB_SHARDS)][obj_id] = obj_json
+            return ShardedObjects([cls._build_shard(shard_json)
+                                   for shard_json in split])
+        return cls._build_shard(objs_json)
+
+    @classmethod
+    def _build_shard(cls, objs_json: dict) -> dict:
+        """ New mapping of the objects of one shard (of the whole class
+        without sharding)
+        """
+        if DB_STORAGE == "compact":
+            return ColumnStore(cls, objs_json)
+        if DB_LAZY_LOAD:
+            return LazyObjects(cls, objs_json)
+        return {obj_id: cls(**obj_json)
+                for obj_id, obj_json in objs_json.items()}
+
+    @classmethod
+    def _shards(cls, obj_ids: Iterable[str]) -> List[int]:
+        """ Shards of the IDs `obj_ids`, None without sharding (the whole
+        file is written)
+        """
+        if DB_SHARDS <= 1:
+            return None
+        return sorted({shard_of(obj_id, DB_SHARDS) for obj_id in obj_ids})
+
+    @classmethod
+    def _file_paths(cls) -> List[str]:
+        """ Files of the class, one per shard
+        """
+        extension = "bin" if DB_FORMAT == "binary" else "json"
+        return [shard_path(cls.__name__, i, DB_SHARDS, extension)
+                for i in range(max(DB_SHARDS, 1))]
+
+    @classmethod
+    def _file_keys(cls) -> List[Tuple[int, int, int]]:
+        """ Keys of the files of the class, one per shard
+        """
+        return [file_key(file_path) for file_path in cls._file_paths()]
+
+    @classmethod
+    def _objs_json(cls, shards: Iterable[int] = None) -> dict:
+        """ All objects of the class (or of `shards`) as JSON dictionaries
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
+        objs = DATA[s_class]
+        if isinstance(objs, ShardedObjects):
+            items = objs.raw_items(shards)
+        elif hasattr(objs, 'raw_items'):
+            items = objs.raw_items()
+        else:
+            items = list(objs.items())
         objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        for obj_id, obj in items:
+            if type(obj) is dict:
+                objs_json[obj_id] = obj
+            else:
+                objs_json[obj_id] = obj.to_json(True)
+        return objs_json
+
+    @classmethod
+    def _read_file(cls, shards: Iterable[int] = None) -> Tuple[
+            dict, List[Tuple[int, int, int]]]:
+        """ Objects of the files (of `shards`, all by default) as JSON
+        dictionaries, and the keys of the files read (None for the others)
+        With DB_FORMAT=binary and DB_LAZY_LOAD=1, objects are returned as
+        snapshot records, only decoded when they are first accessed
+        """
+        file_paths = cls._file_paths()
+        keys = [None] * len(file_paths)
+        objs_json = {}
+        for i in range(len(file_paths)) if shards is None else shards:
+            try:
+                if DB_FORMAT == "binary":
+                    snap = Snapshot(file_paths[i])
+                    stat = snap.stat
+                    if cls._lazy_records():
+                        objs_json.update(snap.records())
+                    elif DB_MULTIPROCESS:
+                        objs_json.update({
+                            obj_id: snapshot.format_timestamps(obj_json)
+                            for obj_id, obj_json in snap.read_all().items()})
+                    else:
+                        objs_json.update(snap.read_all())
+                else:
+                    with open(file_paths[i], 'r') as f:
+                        stat = os.fstat(f.fileno())
+                        objs_json.update(json.load(f))
+                keys[i] = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                continue
+        return objs_json, keys
+
+    @classmethod
+    def _lazy_records(cls) -> bool:
+        """ Whether binary snapshots are loaded as undecoded records (the
+        other modes need every JSON dictionary at load)
+        """
+        return (DB_LAZY_LOAD and DB_STORAGE != "compact" and
+                not DB_MULTIPROCESS)
+
+    @classmethod
+    def _write_file(cls, objs_json: dict, shards: Iterable[int] = None):
+        """ Replace the content of the files (of `shards`, all by default)
+        with `objs_json`
+        """
+        file_paths = cls._file_paths()
+        if shards is None:
+            shards = range(len(file_paths))
+        split = {i: {} for i in shards}
+        for obj_id, obj_json in objs_json.items():
+            shard_json = split.get(shard_of(obj_id, DB_SHARDS))
+            if shard_json is not None:
+                shard_json[obj_id] = obj_json
+        for i, shard_json in split.items():
+            directory, name = os.path.split(file_paths[i])
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", prefix=name + ".",
+                                            dir=directory or ".")
+            try:
+                os.chmod(tmp_path, 0o666 & ~UMASK)
+                with os.fdopen(fd, 'wb' if DB_FORMAT == "binary" else 'w') \
+                        as f:
+                    if DB_FORMAT == "binary":
+                        snapshot.dump(f, shard_json, cls.indexed_attributes)
+                    else:
+                        json.dump(shard_json, f)
+                    if DB_WRITE_BEHIND > 0:
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(tmp_path, file_paths[i])
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    @classmethod
+    def _defer_write(cls, obj_id: str):
+        """ Mark `obj_id` as changed, to be written by the background
+        flusher of the class within DB_WRITE_BEHIND seconds
+        """
+        s_class = cls.__name__
+        DIRTY.setdefault(s_class, set()).add(obj_id)
+        flusher = FLUSHERS.get(s_class)
+        if flusher is None:
+            if len(FLUSHERS) == 0:
+                atexit.register(flush_all)
+            flusher = FLUSHERS[s_class] = (cls, threading.Event(),
+                                           threading.Lock())
+            threading.Thread(target=cls._run_flusher, args=(flusher[1],),
+                             daemon=True).start()
+        flusher[1].set()
+
+    @classmethod
+    def _run_flusher(cls, event: threading.Event):
+        """ Body of the background flusher: once a change is signaled,
+        wait DB_WRITE_BEHIND seconds, so that the changes made meanwhile
+        are written at once, then write them
+        """
+        while True:
+            event.wait()
+            time.sleep(DB_WRITE_BEHIND)
+            event.clear()
+            try:
+                cls.flush()
+            except OSError:
+                event.set()
+
+    @classmethod
+    @timed("base.flush")
+    def flush(cls):
+        """ Write the changes of the class not written yet (write-behind
+        mode, DB_WRITE_BEHIND > 0)
+
+        The objects are collected under the lock of the class, but written
+        and synced to the disk without holding it (only the writer lock),
+        so that saves are not delayed by the disk (except with
+        DB_MULTIPROCESS=1, where the file lock must be held until the file
+        is replaced).
+        """
+        s_class = cls.__name__
+        flusher = FLUSHERS.get(s_class)
+        if flusher is None:
+            return
+        with flusher[2]:
+            if DB_MULTIPROCESS:
+                with cls._write_lock():
+                    if DIRTY.get(s_class):
+                        cls.save_to_file(cls._shards(DIRTY[s_class]))
+                        DIRTY[s_class].clear()
+                return
+            writer = cls._writer()
+            with cls._lock():
+                if not DIRTY.get(s_class):
+                    return
+                writer.acquire()
+                try:
+                    pending = set(DIRTY[s_class])
+                    shards = cls._shards(pending)
+                    objs_json = cls._objs_json(shards)
+                    DIRTY[s_class].clear()
+                except BaseException:
+                    writer.release()
+                    raise
+            try:
+                try:
+                    cls._write_file(objs_json, shards)
+                finally:
+                    writer.release()
+            except Exception:
+                with cls._lock():
+                    DIRTY.setdefault(s_class, set()).update(pending)
+                raise
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def _journal(cls) -> Journal:
+        """ Journal of the class
+        """
+        s_class = cls.__name__
+        if JOURNALS.get(s_class) is None:
+            JOURNALS[s_class] = Journal(".db_{}.journal".format(s_class),
+                                        DB_JOURNAL_COMPACT_EVERY)
+        return JOURNALS[s_class]
 
+    @timed("base.save")
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        with self._write_lock():
+            self.updated_at = datetime.utcnow()
+            if self.id not in DATA[s_class]:
+                insort(ORDERED_IDS[s_class], self.id)
+            DATA[s_class][self.id] = self
+            self._index_add()
+            obj_json = self.to_json(True)
+            if DB_PERSISTENCE == "journal":
+                self._journal().append("save", self.id, obj_json,
+                                       compact=self.__class__.save_to_file)
+                self.__class__._written()
+            elif DB_WRITE_BEHIND > 0:
+                self.__class__._defer_write(self.id)
+            else:
+                self.__class__.save_to_file(self._shards([self.id]))
+            self.__class__._seen(self.id, obj_json)
+        self._notify("save", self)
+
+    @classmethod
+    @timed("base.save_all")
+    def save_all(cls, objs: Iterable[TypeVar('Base')]):
+        """ Save several objects of the class, writing the file only once
+        (in journal mode, the journal is compacted into it)
+        """
+        s_class = cls.__name__
+        objs = list(objs)
+        with cls._write_lock():
+            ids = ORDERED_IDS[s_class]
+            new_ids = []
+            for obj in objs:
+                obj.updated_at = datetime.utcnow()
+                if obj.id not in DATA[s_class]:
+                    new_ids.append(obj.id)
+                DATA[s_class][obj.id] = obj
+                obj._index_add()
+                if DB_MULTIPROCESS:
+                    cls._seen(obj.id, obj.to_json(True))
+            if len(new_ids) > 0:
+                ids.extend(new_ids)
+                ids.sort()
+            if DB_PERSISTENCE != "journal" and DB_WRITE_BEHIND > 0:
+                for obj in objs:
+                    cls._defer_write(obj.id)
+            else:
+                cls.save_to_file(cls._shards(obj.id for obj in objs))
+        for obj in objs:
+            cls._notify("save", obj)
 
+    @timed("base.remove")
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        with self._write_lock():
+            if self.__class__._unstore(self.id) is None:
+                return
+            if DB_PERSISTENCE == "journal":
+                self._journal().append("remove", self.id,
+                                       compact=self.__class__.save_to_file)
+                self.__class__._written()
+            elif DB_WRITE_BEHIND > 0:
+                self.__class__._defer_write(self.id)
+            else:
+                self.__class__.save_to_file(self._shards([self.id]))
+            self.__class__._seen(self.id, None)
+        self._notify("remove", self)
+
+    @classmethod
+    def _store(cls, obj_id: str, obj_json: dict) -> TypeVar('Base'):
+        """ Build an object from its JSON dictionary and store it, without
+        writing it
+        """
+        s_class = cls.__name__
+        obj = cls(**obj_json)
+        if obj_id not in DATA[s_class]:
+            insort(ORDERED_IDS[s_class], obj_id)
+        DATA[s_class][obj_id] = obj
+        cls._index_put(obj_id, obj_json)
+        return obj
+
+    @classmethod
+    def _unstore(cls, obj_id: str) -> TypeVar('Base'):
+        """ Drop an object from the memory, without writing it
+        Return the dropped object, or None if it was not stored
+        """
+        s_class = cls.__name__
+        obj = DATA[s_class].get(obj_id)
+        if obj is None:
+            return None
+        del DATA[s_class][obj_id]
+        ids = ORDERED_IDS[s_class]
+        i = bisect_left(ids, obj_id)
+        if i < len(ids) and ids[i] == obj_id:
+            del ids[i]
+        cls._index_pop(obj_id)
+        return obj
+
+    @classmethod
+    @timed("base.refresh")
+    def refresh(cls):
+        """ Apply the changes written by the other processes since the
+        last load, write or refresh (DB_MULTIPROCESS=1 only)
+
+        When nothing changed this costs one stat() per file, so it can be
+        called before each request. Only the records that changed are
+        rebuilt, and the listeners are notified of them.
+        """
+        if not DB_MULTIPROCESS:
+            return
+        state = FILE_STATES.get(cls.__name__)
+        if state is None or not cls._changed(state):
+            return
+        with cls._write_lock():
+            pass
+
+    @classmethod
+    def _changed(cls, state: dict) -> bool:
+        """ Whether the files differ from what this process last saw
+        """
+        if cls._file_keys() != state["file"]:
+            return True
+        if DB_PERSISTENCE != "journal":
+            return False
+        key = file_key(cls._journal().file_path)
+        inode, offset = state["journal"]
+        if key is None:
+            return inode is not None
+        return key[0] != inode or key[2] != offset
+
+    @classmethod
+    def _refresh_locked(cls) -> List[Tuple[str, TypeVar('Base')]]:
+        """ Apply the changes of the other processes, the locks being held
+        Return the (op, obj) notifications to send
+        """
+        state = FILE_STATES.get(cls.__name__)
+        if state is None or not cls._changed(state):
+            return []
+        journal = cls._journal() if DB_PERSISTENCE == "journal" else None
+        keys = cls._file_keys()
+        inode, offset = state["journal"]
+        if journal is not None and keys == state["file"]:
+            journal_key = file_key(journal.file_path)
+            if journal_key is not None and journal_key[0] == inode:
+                records, offset, inode = journal.read_from(offset)
+                state["journal"] = (inode, offset)
+                changes = [cls._apply(record["id"], record.get("obj"))
+                           for record in records]
+                return [(op, obj) for op, obj in changes if obj is not None]
+        shards = None
+        if journal is None and len(keys) == len(state["file"]):
+            shards = [i for i, key in enumerate(keys)
+                      if key != state["file"][i]]
+        objs_json, read_keys = cls._read_file(shards)
+        for i in range(len(keys)) if shards is None else shards:
+            state["file"][i] = read_keys[i]
+        if journal is not None:
+            records, offset, inode = journal.read_from(0)
+            Journal.fold(objs_json, records)
+            state["journal"] = (inode, offset)
+        seen = state["seen"]
+        dirty = DIRTY.get(cls.__name__, ())
+        changes = []
+        for obj_id, obj_json in objs_json.items():
+            if obj_id in dirty:
+                continue
+            if seen.get(obj_id) != fingerprint(obj_json):
+                changes.append(cls._apply(obj_id, obj_json))
+        removed = [i for i in seen if i not in objs_json and (
+            shards is None or shard_of(i, DB_SHARDS) in shards)]
+        for obj_id in removed:
+            if obj_id not in dirty:
+                changes.append(cls._apply(obj_id, None))
+        return [(op, obj) for op, obj in changes if obj is not None]
+
+    @classmethod
+    def _apply(cls, obj_id: str,
+               obj_json: dict) -> Tuple[str, TypeVar('Base')]:
+        """ Store (or drop, if `obj_json` is None) an object written by
+        another process
+        """
+        cls._seen(obj_id, obj_json)
+        if obj_json is None:
+            return "remove", cls._unstore(obj_id)
+        return "save", cls._store(obj_id, obj_json)
+
+    @classmethod
+    def _seen(cls, obj_id: str, obj_json: dict):
+        """ Remember the JSON dictionary of an object as written in the
+        files (None if it was removed)
+        """
+        state = FILE_STATES.get(cls.__name__)
+        if state is None:
+            return
+        if obj_json is None:
+            state["seen"].pop(obj_id, None)
+        else:
+            state["seen"][obj_id] = fingerprint(obj_json)
+
+    @classmethod
+    def _written(cls):
+        """ Remember the files as just written by this process, so that
+        its own writes are not applied again by refresh
+        """
+        state = FILE_STATES.get(cls.__name__)
+        if state is None:
+            return
+        state["file"] = cls._file_keys()
+        if DB_PERSISTENCE == "journal":
+            key = file_key(cls._journal().file_path)
+            state["journal"] = (None, 0) if key is None else (key[0], key[2])
+
+    @classmethod
+    def subscribe(cls, callback: Callable[[str, TypeVar('Base')], None]):
+        """ Register `callback(op, obj)`, called after each "save" or
+        "remove" of an object of the class, and after each "load" (with
+        `obj` None)
+        """
+        s_class = cls.__name__
+        LISTENERS.setdefault(s_class, []).append(callback)
+
+    @classmethod
+    def _notify(cls, op: str, obj: TypeVar('Base')):
+        """ Call the listeners of the class
+        """
+        for callback in LISTENERS.get(cls.__name__, []):
+            callback(op, obj)
 
     @classmethod
     def count(cls) -> int:
@@ -114,6 +742,37 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def page(cls, cursor: str = None,
+             limit: int = 100) -> Tuple[List[TypeVar('Base')], str]:
+        """ Return up to `limit` objects in ID order, starting after the ID
+        `cursor`, and the cursor of the next page (None after the last one)
+        """
+        s_class = cls.__name__
+        ids = ORDERED_IDS[s_class]
+        start = 0 if cursor is None else bisect_right(ids, cursor)
+        page_ids = ids[start:start + limit]
+        objs = []
+        for obj_id in page_ids:
+            obj = DATA[s_class].get(obj_id)
+            if obj is not None:
+                objs.append(obj)
+        next_cursor = None
+        if len(page_ids) > 0 and start + limit < len(ids):
+            next_cursor = page_ids[-1]
+        return objs, next_cursor
+
+    @classmethod
+    def iterate(cls, chunk_size: int = 1000) -> Iterator[TypeVar('Base')]:
+        """ Iterate over all objects in ID order, one page at a time
+        """
+        cursor = None
+        while True:
+            objs, cursor = cls.page(cursor, chunk_size)
+            yield from objs
+            if cursor is None:
+                return
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
@@ -122,6 +781,7 @@ class Base():
         return DATA[s_class].get(id)
 
     @classmethod
+    @timed("base.search")
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
@@ -133,6 +793,85 @@ class Base():
                 if (getattr(obj, k) != v):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+
+        candidates = cls._index_candidates(attributes)
+        if candidates is None:
+            candidates = list(DATA[s_class].values())
+        return list(filter(_search, candidates))
+
+    @classmethod
+    def _reset_indexes(cls):
+        """ Drop and re-create the empty indexes of the class
+        """
+        s_class = cls.__name__
+        INDEXES[s_class] = {attr: {} for attr in cls.indexed_attributes}
+        INDEXED_VALUES[s_class] = {}
+        ORDERED_IDS[s_class] = []
+
+    def _index_add(self):
+        """ Index the current object, replacing its previous entries
+        """
+        values = {}
+        for attr in self.indexed_attributes:
+            values[attr] = getattr(self, attr, None)
+        self.__class__._index_put(self.id, values)
+
+    @classmethod
+    def _index_put(cls, obj_id: str, values: dict):
+        """ Index `obj_id` under its indexed attribute values
+        """
+        s_class = cls.__name__
+        cls._index_pop(obj_id)
+        indexed = {}
+        for attr, index in INDEXES[s_class].items():
+            value = values.get(attr)
+            try:
+                index.setdefault(value, {})[obj_id] = None
+            except TypeError:
+                continue
+            indexed[attr] = value
+        INDEXED_VALUES[s_class][obj_id] = indexed
+
+    @classmethod
+    def _index_pop(cls, obj_id: str):
+        """ Remove `obj_id` from the indexes
+        """
+        s_class = cls.__name__
+        values = INDEXED_VALUES[s_class].pop(obj_id, None)
+        if values is None:
+            return
+        for attr, value in values.items():
+            bucket = INDEXES[s_class][attr].get(value)
+            if bucket is None:
+                continue
+            bucket.pop(obj_id, None)
+            if len(bucket) == 0:
+                del INDEXES[s_class][attr][value]
+
+    @classmethod
+    def _index_candidates(cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Objects that may match the attributes according to the indexes,
+        or None if no indexed attribute can narrow the search
+        """
+        s_class = cls.__name__
+        indexes = INDEXES.get(s_class, {})
+        ids = None
+        for k, v in attributes.items():
+            if k not in indexes:
+                continue
+            try:
+                bucket = indexes[k].get(v, {})
+            except TypeError:
+                continue
+            if ids is None or len(bucket) < len(ids):
+                ids = bucket
+        if ids is None:
+            return None
+        objs = DATA[s_class]
+        candidates = []
+        for obj_id in list(ids):
+            obj = objs.get(obj_id)
+            if obj is not None:
+                candidates.append(obj)
+        return candidates
 
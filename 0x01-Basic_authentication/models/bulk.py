@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+""" Bulk module
+
+Run `python3 -m models.bulk import <file>` to import users from an NDJSON
+or CSV file (`-` for the standard input), and
+`python3 -m models.bulk export [--format csv]` to write all users, with
+their password hashes, to the standard output.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from os import getenv
+from typing import Dict, Iterable, Iterator, List
+import csv
+import io
+import json
+import os
+
+from models.password import configured_scheme, hash_password
+from models.user import User
+
+
+BULK_WORKERS = int(getenv("BULK_WORKERS", "0"))
+BULK_CHUNK_SIZE = 1000
+CSV_FIELDS = ('id', 'email', '_password', 'first_name', 'last_name',
+              'created_at', 'updated_at')
+
+
+def read_records(lines: Iterable[str], fmt: str = "ndjson") -> Iterator[dict]:
+    """ JSON dictionaries of NDJSON lines, or of CSV lines (with a header;
+    empty cells are left out)
+    Raise ValueError on a line that is not a JSON object
+    """
+    if fmt == "csv":
+        for row in csv.DictReader(lines):
+            yield {k: v for k, v in row.items()
+                   if k is not None and v not in (None, "")}
+        return
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if type(record) is not dict:
+            raise ValueError("a line is not a JSON object")
+        yield record
+
+
+def _chunks(records: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    """ Lists of at most `size` records
+    """
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def _workers() -> int:
+    """ Number of processes hashing the passwords: BULK_WORKERS, or one per
+    CPU for the slow schemes (a SHA256 hash is cheaper than sending the
+    password to another process)
+    """
+    if BULK_WORKERS > 0:
+        return BULK_WORKERS
+    if configured_scheme()[0] == "sha256":
+        return 1
+    return os.cpu_count() or 1
+
+
+def import_users(records: Iterable[dict]) -> Dict[str, int]:
+    """ Create users from JSON dictionaries with `email` and either
+    `password` (clear) or `_password` (already hashed), and optionally
+    `id`, `first_name`, `last_name`, `created_at` and `updated_at`
+
+    Records without a non-empty string email and a non-empty string
+    password are invalid. Records whose email (or ID) already exists
+    (stored, or earlier in the input for emails) are skipped. Passwords
+    are hashed by a pool of processes while the input is read, and all
+    users are saved at once.
+    Return the number of users created, of duplicates and of invalid
+    records
+    """
+    result = {"created": 0, "duplicates": 0, "invalid": 0}
+    scheme, params = configured_scheme()
+    hasher = partial(hash_password, scheme=scheme, params=params)
+    workers = _workers()
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    emails = set()
+    pending = []
+    try:
+        for chunk in _chunks(records, BULK_CHUNK_SIZE):
+            accepted = []
+            for record in chunk:
+                email = record.get("email")
+                password = record.pop("password", None)
+                hashed = record.get("_password")
+                if type(email) is not str or email == "" or \
+                        type(password) not in (str, type(None)) or \
+                        type(hashed) not in (str, type(None)) or \
+                        (not password and not hashed):
+                    result["invalid"] += 1
+                    continue
+                obj_id = record.get("id")
+                if email in emails or \
+                        len(User.search({"email": email})) > 0 or \
+                        (obj_id is not None and User.get(obj_id) is not None):
+                    result["duplicates"] += 1
+                    continue
+                emails.add(email)
+                accepted.append((record, password))
+            to_hash = [(r, p) for r, p in accepted if not r.get("_password")]
+            passwords = [p for r, p in to_hash]
+            if pool is None:
+                hashes = map(hasher, passwords)
+            else:
+                hashes = pool.map(hasher, passwords,
+                                  chunksize=max(1, len(passwords) // workers))
+            pending.append((accepted, [r for r, p in to_hash], hashes))
+        users = []
+        for accepted, to_hash, hashes in pending:
+            for record, hashed in zip(to_hash, hashes):
+                record["_password"] = hashed
+            users.extend(User(**record) for record, password in accepted)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    User.save_all(users)
+    result["created"] = len(users)
+    return result
+
+
+def export_users(fmt: str = "ndjson",
+                 with_passwords: bool = False) -> Iterator[str]:
+    """ All users in ID order, as NDJSON lines or CSV lines (with a
+    header), one user at a time
+    Password hashes are only included if `with_passwords`
+    """
+    if fmt == "csv":
+        fields = [f for f in CSV_FIELDS if with_passwords or f[0] != '_']
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fields, extrasaction='ignore')
+        writer.writeheader()
+        for user in User.iterate(BULK_CHUNK_SIZE):
+            writer.writerow(user.to_json(with_passwords))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell() > 0:
+            yield buffer.getvalue()
+        return
+    for user in User.iterate(BULK_CHUNK_SIZE):
+        yield json.dumps(user.to_json(with_passwords)) + "\n"
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(prog="python3 -m models.bulk")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("file", nargs="?", default="-")
+    parser.add_argument("--format", choices=("ndjson", "csv"))
+    args = parser.parse_args()
+
+    User.load_from_file()
+    if args.command == "import":
+        fmt = args.format
+        if fmt is None:
+            fmt = "csv" if args.file.endswith(".csv") else "ndjson"
+        start = time.time()
+        if args.file == "-":
+            result = import_users(read_records(sys.stdin, fmt))
+        else:
+            with open(args.file, 'r', newline='') as f:
+                result = import_users(read_records(f, fmt))
+        User.flush()
+        result["seconds"] = round(time.time() - start, 3)
+        print(json.dumps(result))
+    else:
+        for line in export_users(args.format or "ndjson", True):
+            sys.stdout.write(line)
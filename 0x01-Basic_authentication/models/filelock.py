@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+""" File lock module
+"""
+import fcntl
+import os
+import threading
+
+
+class FileLock():
+    """ Re-entrant exclusive lock shared by every process using the same
+    lock file
+
+    flock locks belong to an open file description, which threads share
+    and forked processes inherit: the lock file is re-opened in each
+    process, and a thread lock serializes the threads of a process.
+    """
+
+    def __init__(self, file_path: str):
+        """ Initialize a lock on `file_path` (created if needed)
+        """
+        self.file_path = file_path
+        self._thread_lock = threading.RLock()
+        self._fd = None
+        self._pid = None
+        self._depth = 0
+
+    def __enter__(self):
+        """ Acquire the lock
+        """
+        self._thread_lock.acquire()
+        try:
+            if self._depth == 0:
+                if self._pid != os.getpid():
+                    self._fd = os.open(self.file_path,
+                                       os.O_RDWR | os.O_CREAT, 0o600)
+                    self._pid = os.getpid()
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            self._depth += 1
+        except Exception:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *args):
+        """ Release the lock
+        """
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+""" Journal module
+"""
+from contextlib import nullcontext
+from os import path
+from typing import Callable, List, Tuple
+import json
+import os
+import threading
+
+
+class Journal():
+    """ Append-only log of the changes made to one model class
+
+    Each save or remove appends one JSON line, so a write costs O(1)
+    whatever the number of stored objects. Once `compact_every` records
+    have been appended, the log is folded into the snapshot file by a
+    background thread and truncated.
+    """
+
+    def __init__(self, file_path: str, compact_every: int = 1000):
+        """ Initialize a Journal on `file_path`
+        """
+        self.file_path = file_path
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._file = None
+        self._records = 0
+        self._compacting = False
+
+    def _open(self):
+        """ Open (or re-open) the log in append mode
+        The log is re-opened if another process replaced it (compaction)
+        """
+        if self._file is not None:
+            try:
+                replaced = (os.stat(self.file_path).st_ino !=
+                            os.fstat(self._file.fileno()).st_ino)
+            except FileNotFoundError:
+                replaced = True
+            if replaced:
+                self._file.close()
+                self._file = None
+        if self._file is None:
+            self._file = open(self.file_path, 'a')
+
+    def append(self, op: str, obj_id: str, obj_json: dict = None,
+               compact: Callable[[], None] = None):
+        """ Append one record: `op` is "save" (with `obj_json`) or "remove"
+        `compact` is called in a background thread when the log is due
+        for compaction
+        """
+        record = {"op": op, "id": obj_id}
+        if obj_json is not None:
+            record["obj"] = obj_json
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self._open()
+            self._file.write(line)
+            self._file.flush()
+            self._records += 1
+            due = (compact is not None and not self._compacting and
+                   self.compact_every > 0 and
+                   self._records >= self.compact_every)
+            if due:
+                self._compacting = True
+        if due:
+            threading.Thread(target=self._run_compaction, args=(compact,),
+                             daemon=True).start()
+
+    def _run_compaction(self, compact: Callable[[], None]):
+        """ Body of the background compaction thread
+        """
+        try:
+            compact()
+        finally:
+            self._compacting = False
+
+    def read_from(self, offset: int) -> Tuple[List[dict], int, int]:
+        """ Records appended after the byte `offset`, the offset following
+        the last complete record, and the inode of the log (None if there
+        is no log)
+        """
+        if not path.exists(self.file_path):
+            return [], 0, None
+        records = []
+        with open(self.file_path, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                offset += len(line)
+        return records, offset, inode
+
+    @staticmethod
+    def fold(objs_json: dict, records: List[dict]) -> dict:
+        """ Apply `records` to `objs_json` (id -> JSON dict)
+        """
+        for record in records:
+            if record.get("op") == "save":
+                objs_json[record["id"]] = record["obj"]
+            elif record.get("op") == "remove":
+                objs_json.pop(record["id"], None)
+        return objs_json
+
+    def snapshot(self, collect: Callable[[], dict],
+                 write: Callable[[dict], None], lock=None):
+        """ Fold the log into a snapshot
+
+        `collect` returns the current objects as JSON dicts; it runs under
+        `lock` (the lock held by writers while appending, if any) and the
+        journal lock, so that the snapshot matches a position in the log.
+        `write` persists them, then the records already covered by the
+        snapshot are dropped from the log. Snapshots run one at a time: the
+        snapshot lock is taken under `lock` and held until the log is
+        truncated, so that an older snapshot never replaces a newer one.
+        """
+        with lock or nullcontext():
+            self._snapshot_lock.acquire()
+            try:
+                with self._lock:
+                    objs_json = collect()
+                    self._open()
+                    offset = self._file.tell()
+                    records = self._records
+            except BaseException:
+                self._snapshot_lock.release()
+                raise
+        try:
+            write(objs_json)
+            with self._lock:
+                self._file.close()
+                self._file = None
+                tmp_path = self.file_path + ".tmp"
+                with open(self.file_path, 'r') as src, \
+                        open(tmp_path, 'w') as dst:
+                    src.seek(offset)
+                    dst.write(src.read())
+                os.replace(tmp_path, self.file_path)
+                self._records -= records
+        finally:
+            self._snapshot_lock.release()
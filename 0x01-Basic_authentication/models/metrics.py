@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+""" Metrics module
+
+With METRICS=1, the functions decorated with `timed` record how long
+each call takes in a histogram per stage, and `count` increments
+counters. `render` returns everything in the Prometheus text format.
+With METRICS unset, `timed` returns the functions unchanged and `count`
+returns at once, so the instrumentation costs nothing.
+"""
+from bisect import bisect_left
+from functools import wraps
+from os import getenv
+from typing import Callable, Dict, Tuple
+import threading
+import time
+
+
+METRICS_ENABLED = getenv("METRICS", "0") == "1"
+BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05,
+           0.1, 0.5, 1.0, 5.0)
+HISTOGRAMS = {}
+COUNTERS = {}
+GAUGES = {}
+LOCK = threading.Lock()
+
+
+class Histogram():
+    """ Distribution of the durations of one stage
+    """
+
+    def __init__(self):
+        """ Initialize an empty histogram
+        """
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """ Record one duration, in seconds
+        """
+        i = bisect_left(BUCKETS, value)
+        with self._lock:
+            self.buckets[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+def histogram(stage: str) -> Histogram:
+    """ Histogram of `stage`, created if needed
+    """
+    h = HISTOGRAMS.get(stage)
+    if h is None:
+        with LOCK:
+            h = HISTOGRAMS.setdefault(stage, Histogram())
+    return h
+
+
+def timed(stage: str) -> Callable[[Callable], Callable]:
+    """ Decorator recording the duration of each call in the histogram of
+    `stage` (the function is returned unchanged if metrics are disabled)
+    """
+    def decorator(func: Callable) -> Callable:
+        if not METRICS_ENABLED:
+            return func
+        h = histogram(stage)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                h.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def count(name: str, value: int = 1, **labels: str):
+    """ Add `value` to the counter `name` with `labels`
+    """
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with LOCK:
+        COUNTERS[key] = COUNTERS.get(key, 0) + value
+
+
+def gauge(name: str, read: Callable[[], float], **labels: str):
+    """ Register the gauge `name` with `labels`, whose value is returned
+    by `read` when the metrics are rendered
+    """
+    if not METRICS_ENABLED:
+        return
+    with LOCK:
+        GAUGES[(name, tuple(sorted(labels.items())))] = read
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    """ Prometheus representation of labels
+    """
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(
+        k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in labels) + "}"
+
+
+def _families(metrics: Dict[tuple, object]) -> Dict[str, list]:
+    """ Metrics grouped by name
+    """
+    families = {}
+    for (name, labels), value in sorted(metrics.items()):
+        families.setdefault(name, []).append((labels, value))
+    return families
+
+
+def render() -> str:
+    """ All metrics in the Prometheus text format
+    """
+    lines = []
+    with LOCK:
+        histograms = sorted(HISTOGRAMS.items())
+        counters = dict(COUNTERS)
+        gauges = dict(GAUGES)
+    if len(histograms) > 0:
+        lines.append("# HELP api_stage_seconds Duration of each stage")
+        lines.append("# TYPE api_stage_seconds histogram")
+    for stage, h in histograms:
+        with h._lock:
+            buckets, total, n = list(h.buckets), h.sum, h.count
+        cumulative = 0
+        for bound, value in zip(BUCKETS + ("+Inf",), buckets):
+            cumulative += value
+            lines.append("api_stage_seconds_bucket{} {}".format(
+                _labels((("stage", stage), ("le", bound))), cumulative))
+        lines.append("api_stage_seconds_sum{} {}".format(
+            _labels((("stage", stage),)), total))
+        lines.append("api_stage_seconds_count{} {}".format(
+            _labels((("stage", stage),)), n))
+    for name, values in _families(counters).items():
+        lines.append("# TYPE {} counter".format(name))
+        for labels, value in values:
+            lines.append("{}{} {}".format(name, _labels(labels), value))
+    for name, values in _families(gauges).items():
+        lines.append("# TYPE {} gauge".format(name))
+        for labels, read in values:
+            lines.append("{}{} {}".format(name, _labels(labels), read()))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+""" Serializer module
+"""
+from datetime import datetime
+from typing import Iterable, Tuple, TypeVar
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S"
+TIMESTAMP_CACHE_SIZE = 100000
+PLAN_CACHE_SIZE = 1024
+
+
+class Serializer():
+    """ JSON serializer of the objects of one class
+
+    The keys to output are computed once per attribute layout (the keys
+    of the instance __dict__), projection and serialization mode, instead
+    of being filtered for every object. Formatted timestamps are cached.
+    """
+
+    def __init__(self, timestamp_format: str = ISO_FORMAT):
+        """ Initialize an empty serializer
+        """
+        self.timestamp_format = timestamp_format
+        self._plans = {}
+        self._timestamps = {}
+
+    def _plan(self, keys: Tuple[str, ...], for_serialization: bool,
+              fields: Tuple[str, ...]) -> Tuple[str, ...]:
+        """ Keys of an instance __dict__ to output
+        """
+        plan_key = (keys, for_serialization, fields)
+        plan = self._plans.get(plan_key)
+        if plan is None:
+            plan = tuple(
+                key for key in keys
+                if (for_serialization or key[0] != '_') and
+                (fields is None or key in fields))
+            if len(self._plans) >= PLAN_CACHE_SIZE:
+                self._plans.clear()
+            self._plans[plan_key] = plan
+        return plan
+
+    def timestamp(self, value: datetime) -> str:
+        """ Format a datetime with the timestamp format
+        """
+        result = self._timestamps.get(value)
+        if result is None:
+            if (self.timestamp_format == ISO_FORMAT and
+                    value.tzinfo is None and value.year >= 1000):
+                result = value.isoformat(timespec='seconds')
+            else:
+                result = value.strftime(self.timestamp_format)
+            if len(self._timestamps) >= TIMESTAMP_CACHE_SIZE:
+                self._timestamps.clear()
+            self._timestamps[value] = result
+        return result
+
+    def to_json(self, obj: TypeVar('Base'), for_serialization: bool = False,
+                fields: Iterable[str] = None) -> dict:
+        """ Convert an object to a JSON dictionary, keeping only `fields`
+        if given
+        """
+        if fields is not None:
+            fields = tuple(fields)
+        attrs = obj.__dict__
+        result = {}
+        for key in self._plan(tuple(attrs), for_serialization, fields):
+            value = attrs[key]
+            if type(value) is datetime:
+                result[key] = self.timestamp(value)
+            else:
+                result[key] = value
+        return result
+
+
+def dumps(data) -> bytes:
+    """ Encode JSON data to bytes, with orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 """API Routing module."""
 from os import getenv
+from api.v1.auth.rate_limit import rate_limiter_from_env
 from api.v1.views import app_views
+from models import metrics
+from models.user import User
 from flask import Flask, jsonify, abort, request
 from flask_cors import (CORS, cross_origin)
 import os
 from typing_extensions import Literal
-from typing import Tuple
+from typing import Tuple, TypeVar
 
 
 app = Flask(__name__)
@@ -26,24 +29,52 @@ if getenv("AUTH_TYPE") == 'session_auth':
     from api.v1.auth.session_auth import SessionAuth
     auth = SessionAuth()
 
+# set by api.v1.asgi, which resolves the user before calling the app
+CURRENT_USER_KEY = "api.current_user"
+EXCLUDED_PATHS = [
+    '/api/v1/status/',
+    '/api/v1/unauthorized/',
+    '/api/v1/forbidden/',
+    '/api/v1/auth_session/login/'
+]
+if auth is not None:
+    auth.path_matcher(EXCLUDED_PATHS)
+RATE_LIMITER = rate_limiter_from_env()
+
+
+def limited_current_user(req) -> TypeVar('User'):
+    """Resolve the user of a request, within its rate limits (429)."""
+    if RATE_LIMITER is None:
+        return auth.current_user(req)
+    keys = auth.rate_limit_keys(req)
+    if not RATE_LIMITER.acquire(keys):
+        metrics.count("api_auth_rejections_total", status="429")
+        abort(429, description="Too many requests")
+    user = auth.current_user(req)
+    if user is not None:
+        RATE_LIMITER.release(keys)
+    return user
+
 
 @app.before_request
+@metrics.timed("before_request")
 def bef_req():
     """Filter each request before it reaches the appropriate route."""
+    User.refresh()
     if auth is None:
         pass
     else:
-        excluded = [
-            '/api/v1/status/',
-            '/api/v1/unauthorized/',
-            '/api/v1/forbidden/',
-            '/api/v1/auth_session/login/'
-        ]
-        if auth.require_auth(request.path, excluded):
+        if auth.require_auth(request.path, EXCLUDED_PATHS):
             cookie = auth.session_cookie(request)
             if auth.authorization_header(request) is None and cookie is None:
+                metrics.count("api_auth_rejections_total", status="401")
                 abort(401, description="Unauthorized")
-            if auth.current_user(request) is None:
+            if CURRENT_USER_KEY in request.environ:
+                request.current_user = request.environ[CURRENT_USER_KEY]
+            else:
+                request.current_user = limited_current_user(request)
+            if request.current_user is None:
+                metrics.count("api_auth_rejections_total", status="403")
                 abort(403, description="Forbidden")
 
 
@@ -65,6 +96,15 @@ def forbidden(error) -> Tuple[str, Literal[403]]:
     return jsonify({"error": "Forbidden"}), 403
 
 
+@app.errorhandler(429)
+def too_many_requests(error) -> Tuple[str, Literal[429]]:
+    """Handler for rate-limited requests."""
+    resp = jsonify({"error": "Too many requests"})
+    if RATE_LIMITER is not None:
+        resp.headers["Retry-After"] = str(RATE_LIMITER.retry_after)
+    return resp, 429
+
+
 if __name__ == "__main__":
     host = getenv("API_HOST", "0.0.0.0")
     port = getenv("API_PORT", "5000")
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""ASGI entry point of the API.
+
+Serve it with any ASGI server, e.g. `uvicorn api.v1.asgi:app`. Idle
+keep-alive connections only cost the server a coroutine. For each
+request, the changes of the other processes are applied (User.refresh)
+and the rate limiter is checked in a pool of ASGI_THREADS threads
+(default: 32), since both may touch files; the current user is then
+resolved on the event loop, blocking session stores running in the
+default executor. The Flask app runs in the pool too. Responses are
+streamed back chunk by chunk.
+"""
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+from typing import Awaitable, Callable, List, Tuple
+
+from werkzeug.wrappers import Request
+
+import api.v1.app as wsgi
+from models.base import flush_all
+from models.user import User
+
+
+EXECUTOR = ThreadPoolExecutor(int(getenv("ASGI_THREADS", "32")),
+                              thread_name_prefix="asgi")
+
+
+def _environ(scope: dict, body: bytes) -> dict:
+    """Build the WSGI environ of an ASGI HTTP request."""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin1"),
+        "PATH_INFO": scope["path"].encode().decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").lower()
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name in ("content-length", "transfer-encoding"):
+            continue
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        value = value.decode("latin1")
+        if key in environ:
+            value = environ[key] + "," + value
+        environ[key] = value
+    environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
+
+
+async def _read_body(receive: Callable[[], Awaitable[dict]]) -> bytes:
+    """Read the whole body of a request (the server has de-chunked it)."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def _authenticate(environ: dict) -> None:
+    """Resolve the current user without blocking the event loop.
+
+    The user is handed to the Flask app in the environ; requests that
+    must be rejected (including rate-limited ones) are left to the app,
+    which answers them.
+    """
+    auth = wsgi.auth
+    if auth is None:
+        return
+    path = environ["PATH_INFO"].encode("latin1").decode()
+    if not auth.require_auth(path, wsgi.EXCLUDED_PATHS):
+        return
+    request = Request(environ)
+    if auth.authorization_header(request) is None and \
+            auth.session_cookie(request) is None:
+        return
+    loop = asyncio.get_running_loop()
+    limiter = wsgi.RATE_LIMITER
+    keys = [] if limiter is None else auth.rate_limit_keys(request)
+    if len(keys) > 0 and not await loop.run_in_executor(
+            EXECUTOR, limiter.acquire, keys):
+        return
+    user = await auth.current_user_async(request)
+    if len(keys) > 0 and user is not None:
+        await loop.run_in_executor(EXECUTOR, limiter.release, keys)
+    environ[wsgi.CURRENT_USER_KEY] = user
+
+
+def _run_app(environ: dict) -> Tuple[str, List[Tuple[str, str]], object]:
+    """Call the Flask app, in a worker thread."""
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+        return lambda data: None
+
+    body = wsgi.app(environ, start_response)
+    return started[0], started[1], body
+
+
+async def _http(scope: dict, receive: Callable, send: Callable) -> None:
+    """Answer one HTTP request."""
+    loop = asyncio.get_running_loop()
+    environ = _environ(scope, await _read_body(receive))
+    await loop.run_in_executor(EXECUTOR, User.refresh)
+    await _authenticate(environ)
+    status, headers, body = await loop.run_in_executor(
+        EXECUTOR, _run_app, environ)
+    await send({
+        "type": "http.response.start",
+        "status": int(status.split(" ", 1)[0]),
+        "headers": [(k.lower().encode("latin1"), v.encode("latin1"))
+                    for k, v in headers],
+    })
+    chunks = iter(body)
+    try:
+        while True:
+            chunk = await loop.run_in_executor(EXECUTOR, next, chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk,
+                            "more_body": True})
+    finally:
+        if hasattr(body, "close"):
+            await loop.run_in_executor(EXECUTOR, body.close)
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _lifespan(receive: Callable, send: Callable) -> None:
+    """Handle the startup and shutdown of the server."""
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await loop.run_in_executor(EXECUTOR, flush_all)
+            EXECUTOR.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope: dict, receive: Callable, send: Callable) -> None:
+    """ASGI application of the API."""
+    if scope["type"] == "http":
+        await _http(scope, receive, send)
+    elif scope["type"] == "lifespan":
+        await _lifespan(receive, send)
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 """class Auth."""
+import asyncio
 import os
 from flask import request
+from .path_matcher import PathMatcher
+from models.metrics import timed
 from typing import (
     List,
     TypeVar
@@ -11,25 +14,28 @@ from typing import (
 class Auth:
     """Manages the API authentication process."""
 
+    def __init__(self) -> None:
+        """Initialize the compiled excluded paths."""
+        self._path_matchers = {}
+
+    @timed("auth.require_auth")
     def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
         """Determine whether a specific path requires authentication."""
         if path is None:
             return True
         elif excluded_paths is None or excluded_paths == []:
             return True
-        elif path in excluded_paths:
-            return False
-        else:
-            for i in excluded_paths:
-                if i.startswith(path):
-                    return False
-                if path.startswith(i):
-                    return False
-                if i[-1] == "*":
-                    if path.startswith(i[:-1]):
-                        return False
-        return True
+        return not self.path_matcher(excluded_paths).matches(path)
+
+    def path_matcher(self, excluded_paths: List[str]) -> PathMatcher:
+        """Return the compiled matcher of a list of excluded paths."""
+        key = tuple(excluded_paths)
+        matcher = self._path_matchers.get(key)
+        if matcher is None:
+            matcher = self._path_matchers[key] = PathMatcher(key)
+        return matcher
 
+    @timed("auth.authorization_header")
     def authorization_header(self, request=None) -> str:
         """Retrieve the authorization header from the request object."""
         if request is None:
@@ -43,6 +49,17 @@ class Auth:
         """Retrieve the current user based on the request object."""
         return None
 
+    def rate_limit_keys(self, request=None) -> List[str]:
+        """Return the rate-limit buckets charged for a credential check."""
+        if request is None or not request.remote_addr:
+            return []
+        return ["ip:" + request.remote_addr]
+
+    async def current_user_async(self, request=None) -> TypeVar('User'):
+        """Retrieve the current user in the default executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.current_user, request)
+
     def session_cookie(self, request=None):
         """Returns a cookie from request"""
         if request is None:
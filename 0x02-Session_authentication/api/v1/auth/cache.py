@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""class LRUCache."""
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """Bounded least-recently-used cache with a time-to-live."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0) -> None:
+        """Initialize an empty cache of at most `max_size` entries."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Return the value cached under `key`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, tag, expires = entry
+            if expires < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, tag: Hashable = None) -> None:
+        """Cache `value` under `key`, optionally grouped under `tag`."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, tag, time.monotonic() + self.ttl)
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def delete(self, key: Hashable) -> None:
+        """Remove `key` from the cache."""
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        """Remove every entry cached under `tag`."""
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._drop(key)
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self) -> dict:
+        """Return the size and hit/miss counters of the cache."""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def _drop(self, key: Hashable) -> None:
+        """Remove `key`, the lock being held."""
+        value, tag, expires = self._entries.pop(key)
+        if tag is not None:
+            keys = self._tags.get(tag)
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
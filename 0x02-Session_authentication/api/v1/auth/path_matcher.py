@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""class PathMatcher."""
+from typing import Iterable
+
+
+class PathMatcher:
+    """Prefix trie matching request paths against excluded path rules.
+
+    A path matches a rule when one is a prefix of the other, a trailing
+    `*` in a rule being ignored: this is the rule Auth.require_auth has
+    always applied, evaluated in O(len(path)) instead of once per rule.
+    """
+
+    END = object()
+
+    def __init__(self, rules: Iterable[str], cache_size: int = 4096) -> None:
+        """Compile the rules into a trie."""
+        self._root = {}
+        for rule in rules:
+            if not rule:
+                continue
+            if rule[-1] == "*":
+                rule = rule[:-1]
+            node = self._root
+            for char in rule:
+                node = node.setdefault(char, {})
+            node[self.END] = True
+        self._cache = {}
+        self._cache_size = cache_size
+
+    def _match(self, path: str) -> bool:
+        """Walk the trie along `path`."""
+        node = self._root
+        if not node:
+            return False
+        for char in path:
+            if self.END in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return True
+
+    def matches(self, path: str) -> bool:
+        """Return True if `path` matches one of the rules."""
+        result = self._cache.get(path)
+        if result is None:
+            result = self._match(path)
+            if len(self._cache) >= self._cache_size:
+                self._cache.clear()
+            self._cache[path] = result
+        return result
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Token-bucket rate limiting of credential checks.
+
+Each client IP address and each email gets a bucket of RATE_LIMIT_BURST
+tokens (default: 10), refilled at RATE_LIMIT_RATE tokens per second
+(default: 0.5). A credential check takes one token from every bucket of
+the request, and gives it back if the credentials were valid, so only
+failed attempts are counted; once a bucket is empty, requests are refused
+before their credentials are checked.
+
+The backend is selected with the RATE_LIMIT environment variable:
+    - none (default): no rate limiting
+    - memory: per-process dictionary of at most RATE_LIMIT_SLOTS buckets
+    - shm: table of RATE_LIMIT_SLOTS buckets in a memory-mapped file
+      (RATE_LIMIT_PATH, default: .rate_limit.shm), shared by every
+      process opening the same file
+"""
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import List, Tuple
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+
+class RateLimiter(ABC):
+    """
+    Token buckets, stored by the subclasses.
+    """
+
+    def __init__(self, burst: float = 10, rate: float = 0.5) -> None:
+        """
+        Args:
+            burst (float): capacity of a bucket.
+            rate (float): tokens added to a bucket per second.
+        """
+        self.burst = burst
+        self.rate = rate
+
+    @property
+    def retry_after(self) -> int:
+        """
+        Returns:
+            int: seconds for an empty bucket to get a token back.
+        """
+        if self.rate <= 0:
+            return 60
+        return max(1, math.ceil(1 / self.rate))
+
+    def _level(self, tokens: float, stamp: float, now: float) -> float:
+        """
+        Returns:
+            float: tokens of a bucket last updated at `stamp`, at `now`
+            (a full bucket if it was never used).
+        """
+        if stamp == 0:
+            return self.burst
+        return min(self.burst,
+                   tokens + max(0.0, now - stamp) * self.rate)
+
+    @abstractmethod
+    def _locked(self):
+        """
+        Returns:
+            context manager holding the lock of the buckets.
+        """
+
+    @abstractmethod
+    def _load(self, key: str) -> Tuple[float, float]:
+        """
+        Returns:
+            tuple: (tokens, stamp) of a bucket, (0, 0) if it is unknown.
+        """
+
+    @abstractmethod
+    def _store(self, key: str, tokens: float, stamp: float) -> None:
+        """
+        Saves a bucket (a full one may be forgotten).
+        """
+
+    def acquire(self, keys: List[str]) -> bool:
+        """
+        Takes one token from the bucket of each key.
+        Returns:
+            bool: False if a bucket is empty (no token is taken then).
+        """
+        now = time.time()
+        with self._locked():
+            levels = [self._level(*self._load(key), now) for key in keys]
+            if any(level < 1 for level in levels):
+                return False
+            for key, level in zip(keys, levels):
+                self._store(key, level - 1, now)
+        return True
+
+    def release(self, keys: List[str]) -> None:
+        """
+        Gives back the tokens taken by `acquire`.
+        """
+        now = time.time()
+        with self._locked():
+            for key in keys:
+                level = self._level(*self._load(key), now)
+                self._store(key, min(self.burst, level + 1), now)
+
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    Buckets in a dictionary of the process, in least recently updated
+    order. Full buckets are forgotten, and so are the least recently
+    updated ones when there are more than `slots` of them.
+    """
+
+    def __init__(self, burst: float = 10, rate: float = 0.5,
+                 slots: int = 65536) -> None:
+        """
+        Creates an empty table of at most `slots` buckets.
+        """
+        super().__init__(burst, rate)
+        self.slots = slots
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        """
+        Holds the thread lock.
+        """
+        with self._lock:
+            yield
+
+    def _load(self, key: str) -> Tuple[float, float]:
+        """
+        Returns:
+            tuple: (tokens, stamp) of a bucket, (0, 0) if it is unknown.
+        """
+        return self._buckets.get(key, (0, 0))
+
+    def _store(self, key: str, tokens: float, stamp: float) -> None:
+        """
+        Saves a bucket, forgetting it if it is full.
+        """
+        self._buckets.pop(key, None)
+        if tokens >= self.burst:
+            return
+        self._buckets[key] = (tokens, stamp)
+        while len(self._buckets) > self.slots:
+            del self._buckets[next(iter(self._buckets))]
+
+
+class SharedMemoryRateLimiter(RateLimiter):
+    """
+    Hash table of buckets in a memory-mapped file. Every process mapping
+    the same file shares the buckets. Accesses are serialized with flock
+    on a descriptor opened by each process.
+
+    Each slot holds a digest of the key, the tokens and the time of the
+    last update. A key is looked up in PROBES consecutive slots; when none
+    is free, the least recently updated one is taken over.
+    """
+
+    PROBES = 8
+    SLOT = struct.Struct("<16sdd")
+    EMPTY = bytes(16)
+
+    def __init__(self, file_path: str, burst: float = 10,
+                 rate: float = 0.5, slots: int = 65536) -> None:
+        """
+        Maps `file_path`, creating a table of `slots` slots if needed.
+        """
+        super().__init__(burst, rate)
+        self.file_path = file_path
+        self.slots = slots
+        size = slots * self.SLOT.size
+        self._pid = None
+        self._fd = None
+        self._thread_lock = threading.Lock()
+        self._slots = {}
+        with self._locked():
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    @contextmanager
+    def _locked(self):
+        """
+        Holds the thread lock and the file lock of the current process.
+        """
+        with self._thread_lock:
+            if self._pid != os.getpid():
+                self._fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT,
+                                   0o600)
+                self._pid = os.getpid()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                self._slots.clear()
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _slot(self, key: str) -> Tuple[int, bytes]:
+        """
+        Returns:
+            tuple: the slot of `key` (or the one to take over for it) and
+            the digest of `key`, looked up once per locked section.
+        """
+        found = self._slots.get(key)
+        if found is not None:
+            return found
+        digest = hashlib.blake2b(key.encode("utf-8"),
+                                 digest_size=16).digest()
+        start = int.from_bytes(digest[:8], "little") % self.slots
+        oldest, oldest_stamp = start, None
+        for i in range(self.PROBES):
+            slot = (start + i) % self.slots
+            s_digest, tokens, stamp = self.SLOT.unpack_from(
+                self._map, slot * self.SLOT.size)
+            if s_digest == digest or s_digest == self.EMPTY:
+                oldest = slot
+                break
+            if oldest_stamp is None or stamp < oldest_stamp:
+                oldest, oldest_stamp = slot, stamp
+        self._slots[key] = (oldest, digest)
+        return oldest, digest
+
+    def _load(self, key: str) -> Tuple[float, float]:
+        """
+        Returns:
+            tuple: (tokens, stamp) of a bucket, (0, 0) if it is unknown.
+        """
+        slot, digest = self._slot(key)
+        s_digest, tokens, stamp = self.SLOT.unpack_from(
+            self._map, slot * self.SLOT.size)
+        if s_digest != digest:
+            return 0, 0
+        return tokens, stamp
+
+    def _store(self, key: str, tokens: float, stamp: float) -> None:
+        """
+        Saves a bucket in its slot.
+        """
+        slot, digest = self._slot(key)
+        self.SLOT.pack_into(self._map, slot * self.SLOT.size,
+                            digest, tokens, stamp)
+
+
+def rate_limiter_from_env() -> RateLimiter:
+    """
+    Builds the rate limiter selected by the RATE_LIMIT variable.
+    Returns:
+        RateLimiter: the rate limiter, None if rate limiting is disabled.
+    """
+    kind = os.getenv("RATE_LIMIT", "none")
+    burst = float(os.getenv("RATE_LIMIT_BURST", "10"))
+    rate = float(os.getenv("RATE_LIMIT_RATE", "0.5"))
+    slots = int(os.getenv("RATE_LIMIT_SLOTS", "65536"))
+    if kind == "memory":
+        return MemoryRateLimiter(burst, rate, slots)
+    if kind == "shm":
+        return SharedMemoryRateLimiter(
+            os.getenv("RATE_LIMIT_PATH", ".rate_limit.shm"),
+            burst, rate, slots)
+    return None
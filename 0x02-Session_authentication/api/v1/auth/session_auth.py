@@ -4,11 +4,19 @@ Definition of the SessionAuth class for session-based authentication.
 """
 
 import base64
+import os
 from uuid import uuid4
 from typing import TypeVar
 
 from .auth import Auth
+from .cache import LRUCache
+from .session_store import SessionStore, session_store_from_env
+from models import metrics
 from models.user import User
+from models.metrics import timed
+
+
+NO_USER = ""
 
 
 class SessionAuth(Auth):
@@ -16,8 +24,57 @@ class SessionAuth(Auth):
     Session-based authentication class.
     """
 
-    user_id_by_session_id = {}
+    def __init__(self, session_store: SessionStore = None) -> None:
+        """
+        Initializes the session store, and the cache of resolved
+        sessions in front of it.
+        Args:
+            session_store (SessionStore): where sessions are kept, by
+            default the store selected by the SESSION_STORE variable.
+        """
+        super().__init__()
+        if session_store is None:
+            session_store = session_store_from_env()
+        self.session_store = session_store
+        self.session_cache = LRUCache(
+            int(os.getenv("SESSION_CACHE_SIZE", "1024")),
+            float(os.getenv("SESSION_CACHE_TTL", "5")))
+        User.subscribe(self._on_user_change)
+        stats = self.session_cache.stats
+        for stat in stats():
+            metrics.gauge("auth_cache_" + stat,
+                          lambda stat=stat: stats()[stat], cache="sessions")
+
+    def _on_user_change(self, op: str, user: TypeVar('User')) -> None:
+        """
+        Drops the cached sessions of a removed user (every cached session
+        when the users are reloaded).
+        Args:
+            op (str): "save", "remove" or "load".
+            user (User): The saved or removed user, None on "load".
+        """
+        if user is None:
+            self.session_cache.clear()
+        elif op == "remove":
+            self.session_cache.invalidate_tag(user.id)
+
+    def _cache_user_id(self, session_id: str, user_id: str) -> str:
+        """
+        Caches the user ID a session resolved to, NO_USER if the session
+        is invalid (negative caching).
+        Args:
+            session_id (str): The resolved session ID.
+            user_id (str): The user ID returned by the session store.
+        Returns:
+            str: The cached value.
+        """
+        if user_id is None:
+            self.session_cache.set(session_id, NO_USER)
+            return NO_USER
+        self.session_cache.set(session_id, user_id, tag=user_id)
+        return user_id
 
+    @timed("session_auth.create_session")
     def create_session(self, user_id: str = None) -> str:
         """
         Creates a session ID for a user based on the provided user ID.
@@ -26,14 +83,18 @@ class SessionAuth(Auth):
             the session is being created.
         Returns:
             str: The session ID if the user ID is valid.
-            None: If the user ID is None or not a string.
+            None: If the user ID is None or not a string, or if the
+            session store could not keep the session.
         """
         if user_id is None or not isinstance(user_id, str):
             return None
-        session_id = uuid4()
-        self.user_id_by_session_id[str(session_id)] = user_id
-        return str(session_id)
+        session_id = str(uuid4())
+        if not self.session_store.set(session_id, user_id):
+            return None
+        self.session_cache.delete(session_id)
+        return session_id
 
+    @timed("session_auth.user_id_for_session_id")
     def user_id_for_session_id(self, session_id: str = None) -> str:
         """
         Retrieves the user ID associated with a given session ID.
@@ -45,12 +106,15 @@ class SessionAuth(Auth):
         """
         if session_id is None or not isinstance(session_id, str):
             return None
-        return self.user_id_by_session_id.get(session_id)
+        return self.session_store.get(session_id)
 
+    @timed("session_auth.current_user")
     def current_user(self, request=None):
         """
         Retrieves the user instance associated with the
         current session, based on the session cookie.
+        Resolved sessions (valid or not) are cached for SESSION_CACHE_TTL
+        seconds, so that most requests do not query the session store.
         Args:
             request: The request object containing the session cookie.
         Returns:
@@ -58,11 +122,39 @@ class SessionAuth(Auth):
             None: If no user is found for the session.
         """
         session_cookie = self.session_cookie(request)
-        user_id = self.user_id_for_session_id(session_cookie)
+        if session_cookie is None or not isinstance(session_cookie, str):
+            return None
+        user_id = self.session_cache.get(session_cookie)
+        if user_id is None:
+            user_id = self._cache_user_id(
+                session_cookie, self.user_id_for_session_id(session_cookie))
+        if user_id == NO_USER:
+            return None
+        return User.get(user_id)
+
+    async def current_user_async(self, request=None):
+        """
+        Coroutine version of current_user: the session store is queried
+        without blocking the event loop.
+        Args:
+            request: The request object containing the session cookie.
+        Returns:
+            User: The user instance associated with the session.
+            None: If no user is found for the session.
+        """
+        session_cookie = self.session_cookie(request)
+        if session_cookie is None or not isinstance(session_cookie, str):
+            return None
+        user_id = self.session_cache.get(session_cookie)
         if user_id is None:
+            user_id = self._cache_user_id(
+                session_cookie,
+                await self.session_store.get_async(session_cookie))
+        if user_id == NO_USER:
             return None
         return User.get(user_id)
 
+    @timed("session_auth.destroy_session")
     def destroy_session(self, request=None) -> bool:
         """
         Destroys the current session by deleting the associated session ID.
@@ -77,8 +169,6 @@ class SessionAuth(Auth):
         session_cookie = self.session_cookie(request)
         if session_cookie is None:
             return False
-        user_id = self.user_id_for_session_id(session_cookie)
-        if user_id is None:
-            return False
-        del self.user_id_by_session_id[session_cookie]
-        return True
+        deleted = self.session_store.delete(session_cookie)
+        self.session_cache.delete(session_cookie)
+        return deleted
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Session stores used by SessionAuth to map session IDs to user IDs.
+
+The backend is selected with the SESSION_STORE environment variable:
+    - memory (default): per-process dictionary with timing-wheel expiry
+    - shm: fixed-size hash table in a memory-mapped file, shared by
+      every process (e.g. forked gunicorn workers) opening the same file;
+      when the slots of a new session are all taken, the oldest of their
+      sessions is dropped
+    - sqlite: table in a SQLite database file
+SESSION_DURATION sets the lifetime of a session in seconds (0 or unset:
+sessions never expire).
+Every store also has coroutine versions of its methods, for the ASGI
+mode: they run the stores that may block (file locks, disk) in the
+default executor of the event loop.
+"""
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import asyncio
+import fcntl
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+
+class SessionStore(ABC):
+    """
+    Interface of a session store.
+    """
+
+    blocking = True
+
+    def __init__(self, ttl: float = 0) -> None:
+        """
+        Args:
+            ttl (float): lifetime of a session in seconds, 0 for no expiry.
+        """
+        self.ttl = ttl
+
+    def _expires(self) -> float:
+        """
+        Returns:
+            float: expiry time of a session created now (0: never).
+        """
+        if self.ttl > 0:
+            return time.time() + self.ttl
+        return 0.0
+
+    @abstractmethod
+    def set(self, session_id: str, user_id: str) -> bool:
+        """
+        Stores a session.
+        Returns:
+            bool: True if the session was stored.
+        """
+
+    @abstractmethod
+    def get(self, session_id: str) -> str:
+        """
+        Returns:
+            str: the user ID of a live session, None otherwise.
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """
+        Deletes a session.
+        Returns:
+            bool: True if the session existed.
+        """
+
+    async def _call(self, method, *args):
+        """
+        Calls `method` in the default executor if the store may block,
+        directly otherwise.
+        """
+        if not self.blocking:
+            return method(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, method, *args)
+
+    async def set_async(self, session_id: str, user_id: str) -> bool:
+        """
+        Coroutine version of set.
+        """
+        return await self._call(self.set, session_id, user_id)
+
+    async def get_async(self, session_id: str) -> str:
+        """
+        Coroutine version of get.
+        """
+        return await self._call(self.get, session_id)
+
+    async def delete_async(self, session_id: str) -> bool:
+        """
+        Coroutine version of delete.
+        """
+        return await self._call(self.delete, session_id)
+
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process store. Expired sessions are dropped through a timing wheel:
+    sessions are bucketed by expiry second, and each call only visits the
+    buckets that elapsed since the previous call.
+    """
+
+    blocking = False
+
+    def __init__(self, ttl: float = 0) -> None:
+        """
+        Initializes an empty store.
+        """
+        super().__init__(ttl)
+        self._sessions = {}
+        self._wheel = {}
+        self._tick = int(time.time())
+        self._lock = threading.Lock()
+
+    def _advance(self) -> None:
+        """
+        Drops the sessions of every elapsed bucket. The lock must be held.
+        """
+        now = int(time.time())
+        if now <= self._tick or not self._wheel:
+            self._tick = max(now, self._tick)
+            return
+        if now - self._tick < len(self._wheel):
+            ticks = range(self._tick, now)
+        else:
+            ticks = [t for t in self._wheel if t < now]
+        for tick in ticks:
+            for session_id in self._wheel.pop(tick, ()):
+                self._sessions.pop(session_id, None)
+        self._tick = now
+
+    def set(self, session_id: str, user_id: str) -> bool:
+        """
+        Stores a session.
+        """
+        expires = self._expires()
+        with self._lock:
+            self._advance()
+            self._sessions[session_id] = (user_id, expires)
+            if expires:
+                tick = int(expires) + 1
+                self._wheel.setdefault(tick, set()).add(session_id)
+        return True
+
+    def get(self, session_id: str) -> str:
+        """
+        Returns the user ID of a live session.
+        """
+        with self._lock:
+            self._advance()
+            entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        user_id, expires = entry
+        if expires and expires < time.time():
+            return None
+        return user_id
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Deletes a session.
+        """
+        with self._lock:
+            self._advance()
+            entry = self._sessions.pop(session_id, None)
+            if entry is None:
+                return False
+            if entry[1]:
+                bucket = self._wheel.get(int(entry[1]) + 1)
+                if bucket is not None:
+                    bucket.discard(session_id)
+        return True
+
+
+class SharedMemorySessionStore(SessionStore):
+    """
+    Hash table in a memory-mapped file. Every process mapping the same
+    file sees the same sessions. Accesses are serialized with flock on a
+    descriptor opened by each process, so that workers forked after the
+    store was created do not share their lock.
+
+    Each slot holds a state byte, the creation and expiry times and the
+    session and user IDs, which must fit in KEY_SIZE bytes once UTF-8
+    encoded. A session is kept in one of the PROBES consecutive slots
+    following the hash of its ID, so that an access reads at most PROBES
+    slots. A new session takes a free or expired slot among them, or else
+    replaces the oldest session of these slots: the table never fills up.
+    """
+
+    KEY_SIZE = 64
+    PROBES = 16
+    EMPTY, USED = 0, 1
+    SLOT = struct.Struct("<Bdd{}s{}s".format(KEY_SIZE, KEY_SIZE))
+
+    def __init__(self, file_path: str, slots: int = 65536,
+                 ttl: float = 0) -> None:
+        """
+        Maps `file_path`, creating a table of `slots` slots if needed (a
+        file of another size, e.g. of another number of slots, is reset).
+        """
+        super().__init__(ttl)
+        self.file_path = file_path
+        self.slots = slots
+        size = slots * self.SLOT.size
+        self._pid = None
+        self._fd = None
+        self._thread_lock = threading.Lock()
+        with self._locked(fcntl.LOCK_EX):
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    @contextmanager
+    def _locked(self, operation: int):
+        """
+        Holds the thread lock and the file lock (`operation` being
+        LOCK_SH or LOCK_EX) of the current process.
+        """
+        with self._thread_lock:
+            if self._pid != os.getpid():
+                self._fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT,
+                                   0o600)
+                self._pid = os.getpid()
+            fcntl.flock(self._fd, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _probe(self, key: bytes):
+        """
+        Yields the slot numbers where `key` may be stored.
+        """
+        start = zlib.crc32(key) % self.slots
+        for i in range(min(self.PROBES, self.slots)):
+            yield (start + i) % self.slots
+
+    def _read(self, slot: int):
+        """
+        Returns:
+            tuple: (state, created, expires, session_id, user_id) of a
+            slot.
+        """
+        return self.SLOT.unpack_from(self._map, slot * self.SLOT.size)
+
+    def _write(self, slot: int, state: int, created: float = 0.0,
+               expires: float = 0.0, key: bytes = b"",
+               value: bytes = b"") -> None:
+        """
+        Overwrites a slot.
+        """
+        self.SLOT.pack_into(self._map, slot * self.SLOT.size,
+                            state, created, expires, key, value)
+
+    def _find(self, key: bytes) -> int:
+        """
+        Returns:
+            int: the slot holding `key`, or -1.
+        """
+        for slot in self._probe(key):
+            state, created, expires, s_key, value = self._read(slot)
+            if state == self.USED and s_key.rstrip(b"\0") == key:
+                return slot
+        return -1
+
+    def set(self, session_id: str, user_id: str) -> bool:
+        """
+        Stores a session in its slot, a free or expired one, or else the
+        one of the oldest session it may be stored in.
+        """
+        key = session_id.encode("utf-8")
+        value = user_id.encode("utf-8")
+        if len(key) > self.KEY_SIZE or len(value) > self.KEY_SIZE:
+            return False
+        now = time.time()
+        with self._locked(fcntl.LOCK_EX):
+            found, free, oldest, oldest_created = -1, -1, -1, None
+            for slot in self._probe(key):
+                state, created, expires, s_key, s_value = self._read(slot)
+                if state == self.USED and s_key.rstrip(b"\0") == key:
+                    found = slot
+                    break
+                if free < 0 and (state == self.EMPTY or
+                                 (expires and expires < now)):
+                    free = slot
+                if oldest_created is None or created < oldest_created:
+                    oldest, oldest_created = slot, created
+            if found < 0:
+                found = free if free >= 0 else oldest
+            self._write(found, self.USED, now, self._expires(), key, value)
+            return True
+
+    def get(self, session_id: str) -> str:
+        """
+        Returns the user ID of a live session.
+        """
+        key = session_id.encode("utf-8")
+        if len(key) > self.KEY_SIZE:
+            return None
+        with self._locked(fcntl.LOCK_SH):
+            slot = self._find(key)
+            if slot < 0:
+                return None
+            state, created, expires, s_key, value = self._read(slot)
+        if expires and expires < time.time():
+            return None
+        return value.rstrip(b"\0").decode("utf-8")
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Deletes a session, freeing its slot.
+        """
+        key = session_id.encode("utf-8")
+        if len(key) > self.KEY_SIZE:
+            return False
+        with self._locked(fcntl.LOCK_EX):
+            slot = self._find(key)
+            if slot < 0:
+                return False
+            self._write(slot, self.EMPTY)
+            return True
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Store backed by a SQLite table, shared by every process using the
+    same database file. Each thread gets its own connection.
+    """
+
+    def __init__(self, file_path: str, ttl: float = 0) -> None:
+        """
+        Opens `file_path` and creates the sessions table if needed.
+        """
+        super().__init__(ttl)
+        self.file_path = file_path
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                         "session_id TEXT PRIMARY KEY, "
+                         "user_id TEXT NOT NULL, "
+                         "expires REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """
+        Returns:
+            sqlite3.Connection: the connection of the current thread.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.file_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def set(self, session_id: str, user_id: str) -> bool:
+        """
+        Stores a session.
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO sessions "
+                         "(session_id, user_id, expires) VALUES (?, ?, ?)",
+                         (session_id, user_id, self._expires()))
+        return True
+
+    def get(self, session_id: str) -> str:
+        """
+        Returns the user ID of a live session.
+        """
+        row = self._conn().execute(
+            "SELECT user_id FROM sessions WHERE session_id = ? "
+            "AND (expires = 0 OR expires >= ?)",
+            (session_id, time.time())).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Deletes a session, along with every expired one.
+        """
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute("DELETE FROM sessions WHERE session_id = ?",
+                                  (session_id,))
+            conn.execute("DELETE FROM sessions "
+                         "WHERE expires != 0 AND expires < ?", (time.time(),))
+        return cursor.rowcount > 0
+
+
+def session_store_from_env() -> SessionStore:
+    """
+    Builds the session store selected by the SESSION_STORE variable.
+    """
+    try:
+        ttl = float(os.getenv("SESSION_DURATION", "0"))
+    except ValueError:
+        ttl = 0
+    kind = os.getenv("SESSION_STORE", "memory")
+    if kind == "shm":
+        return SharedMemorySessionStore(
+            os.getenv("SESSION_STORE_PATH", ".sessions.shm"),
+            int(os.getenv("SESSION_STORE_SLOTS", "65536")), ttl)
+    if kind == "sqlite":
+        return SQLiteSessionStore(
+            os.getenv("SESSION_STORE_PATH", ".sessions.db"), ttl)
+    return MemorySessionStore(ttl)
@@ -3,19 +3,74 @@
 Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import abort, jsonify, request, Response
+from models.bulk import export_users, import_users, read_records
 from models.user import User
+from models.serializer import dumps
+from typing import Iterator, List
 from base64 import b64decode
 
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+BULK_FIELDS = ('email', 'password', 'first_name', 'last_name')
+
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: maximum number of users to return (at most 1000)
+      - cursor: value of the X-Next-Cursor header of the previous page
+      - stream: if 1, the whole list is sent as it is serialized
+      - fields: comma-separated attributes to return (e.g. id,email)
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, or of one page of them
+        in ID order when `limit` or `cursor` is given
+      - 400 if `limit` is invalid
+    """
+    if request.args.get('stream') == '1':
+        return Response(_stream_users(_fields()), mimetype='application/json')
+    fields = _fields()
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        all_users = [user.to_json(fields=fields) for user in User.all()]
+        return _json_response(all_users)
+    try:
+        limit = int(request.args.get('limit', PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if limit <= 0 or limit > MAX_PAGE_SIZE:
+        return jsonify({'error': "Wrong limit"}), 400
+    users, next_cursor = User.page(request.args.get('cursor'), limit)
+    resp = _json_response([user.to_json(fields=fields) for user in users])
+    if next_cursor is not None:
+        resp.headers['X-Next-Cursor'] = next_cursor
+    return resp
+
+
+def _stream_users(fields: List[str] = None) -> Iterator[bytes]:
+    """ Yield the JSON list of all users piece by piece
+    """
+    yield b'['
+    sep = b''
+    for user in User.iterate(PAGE_SIZE):
+        yield sep + dumps(user.to_json(fields=fields))
+        sep = b','
+    yield b']'
+
+
+def _fields() -> List[str]:
+    """ Attributes requested with the `fields` query parameter, or None
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return [field for field in fields.split(',') if field]
+
+
+def _json_response(data) -> Response:
+    """ JSON response encoded with the fast encoder of the models
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    return Response(dumps(data), mimetype='application/json')
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -23,6 +78,8 @@ def view_one_user(user_id: str = None) -> str:
     """ GET /api/v1/users/:id
     Path parameter:
       - User ID
+    Query parameter (optional):
+      - fields: comma-separated attributes to return (e.g. id,email)
     Return:
       - User object JSON represented
       - 404 if the User ID doesn't exist
@@ -30,11 +87,11 @@ def view_one_user(user_id: str = None) -> str:
     if not user_id or (user_id == 'me' and not request.current_user):
         return abort(404)
     if user_id == 'me' and request.current_user:
-        return jsonify(request.current_user.to_json())
+        return _json_response(request.current_user.to_json(fields=_fields()))
     user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    return _json_response(user.to_json(fields=_fields()))
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -93,6 +150,40 @@ def create_user() -> str:
     return jsonify({'error': error_msg}), 400
 
 
+@app_views.route('/users/bulk', methods=['POST'], strict_slashes=False)
+def import_bulk_users() -> str:
+    """ POST /api/v1/users/bulk
+    Body: one user per line, as NDJSON (default) or CSV with a header
+    (Content-Type: text/csv); fields: email, password, last_name
+    (optional) and first_name (optional)
+    Return:
+      - number of users created, of duplicate emails and of invalid lines
+      - 400 if the body can't be parsed
+    """
+    fmt = "csv" if request.mimetype == "text/csv" else "ndjson"
+    lines = (line.decode('utf-8') for line in request.stream)
+    records = ({k: v for k, v in record.items() if k in BULK_FIELDS}
+               for record in read_records(lines, fmt))
+    try:
+        result = import_users(records)
+    except ValueError as e:
+        return jsonify({'error': "Wrong format: {}".format(e)}), 400
+    return jsonify(result), 201
+
+
+@app_views.route('/users/bulk', methods=['GET'], strict_slashes=False)
+def export_bulk_users() -> str:
+    """ GET /api/v1/users/bulk
+    Query parameter (optional):
+      - format: ndjson (default) or csv
+    Return:
+      - all users in ID order, streamed one line per user
+    """
+    if request.args.get('format') == 'csv':
+        return Response(export_users('csv'), mimetype='text/csv')
+    return Response(export_users('ndjson'), mimetype='application/x-ndjson')
+
+
 @app_views.route('/users/<user_id>', methods=['PUT'], strict_slashes=False)
 def update_user(user_id: str = None) -> str:
     """ PUT /api/v1/users/:id
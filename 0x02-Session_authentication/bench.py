@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+""" Benchmarks of the authentication and storage hot paths
+
+    python3 bench.py [--sizes 1000,100000,1000000] [--output results.json]
+                     [--baseline baseline.json] [--threshold 1.25]
+
+Everything runs offline, in a temporary directory, against stores of
+each size. Results are printed (or written to --output) as JSON: number
+of runs, mean, median and 99th percentile per call, in microseconds.
+With --baseline (a previous output), the command fails if the mean of a
+benchmark grew by more than --threshold times.
+"""
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+import argparse
+import base64
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SIZES = (1000, 100000, 1000000)
+PASSWORD = "H0lbertonSchool98!"
+SESSION_NAME = "_my_session_id"
+MIN_TIME = 0.2
+MIN_RUNS = 3
+MAX_RUNS = 100000
+
+
+def measure(func: Callable[[], object]) -> Dict[str, float]:
+    """ Call `func` at least MIN_RUNS times and for MIN_TIME seconds
+    Return the number of runs and the mean, median and 99th percentile
+    durations in microseconds
+    """
+    times = []
+    start = time.perf_counter()
+    while len(times) < MAX_RUNS and (
+            len(times) < MIN_RUNS or time.perf_counter() - start < MIN_TIME):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    times.sort()
+    return {
+        "runs": len(times),
+        "mean_us": round(sum(times) / len(times) * 1e6, 3),
+        "p50_us": round(times[len(times) // 2] * 1e6, 3),
+        "p99_us": round(times[min(len(times) - 1,
+                                  int(len(times) * 0.99))] * 1e6, 3)
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """ Benchmarks whose mean exceeds `threshold` times the baseline one
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None or base["mean_us"] <= 0:
+            continue
+        ratio = result["mean_us"] / base["mean_us"]
+        if ratio > threshold:
+            regressions.append("{}: {:.1f}us -> {:.1f}us (x{:.2f})".format(
+                name, base["mean_us"], result["mean_us"], ratio))
+    return regressions
+
+
+def record(results: dict, name: str, func: Callable[[], object]):
+    """ Measure `func` into `results`, reporting progress on stderr
+    """
+    results[name] = measure(func)
+    print("{}: {}".format(name, results[name]), file=sys.stderr)
+
+
+def populate(count: int):
+    """ Store `count` users sharing the same password, written once
+    """
+    from models.password import hash_password
+    from models.user import User
+
+    pwd_hash = hash_password(PASSWORD)
+    User.save_all(User(email="user{}@example.com".format(i),
+                       _password=pwd_hash) for i in range(count))
+
+
+def run(size: int, results: dict):
+    """ Run every benchmark against a new store of `size` users
+    """
+    from api.v1 import app as app_module
+    from api.v1.auth.basic_auth import BasicAuth
+    from api.v1.auth.session_auth import SessionAuth
+    from models.user import User
+
+    os.chdir(tempfile.mkdtemp(dir=os.getcwd()))
+    User.load_from_file()
+    populate(size)
+    email = "user{}@example.com".format(size // 2)
+    user = User.search({"email": email})[0]
+    basic_auth = BasicAuth()
+    session_auth = SessionAuth()
+    header = "Basic " + base64.b64encode(
+        "{}:{}".format(email, PASSWORD).encode()).decode()
+    session_id = session_auth.create_session(user.id)
+    basic_request = SimpleNamespace(headers={"Authorization": header},
+                                    cookies={})
+    session_request = SimpleNamespace(headers={},
+                                      cookies={SESSION_NAME: session_id})
+
+    def uncached_basic_auth():
+        basic_auth.credential_cache.clear()
+        basic_auth.current_user(basic_request)
+
+    benchmarks = {
+        "base.get": lambda: User.get(user.id),
+        "base.search_email": lambda: User.search({"email": email}),
+        "base.search_scan": lambda: User.search({"first_name": "none"}),
+        "base.save": user.save,
+        "basic_auth.current_user": lambda: basic_auth.current_user(
+            basic_request),
+        "basic_auth.current_user_uncached": uncached_basic_auth,
+        "session_auth.current_user": lambda: session_auth.current_user(
+            session_request)
+    }
+
+    for name, func in benchmarks.items():
+        record(results, "{}[{}]".format(name, size), func)
+
+    client = app_module.app.test_client()
+    client.set_cookie(SESSION_NAME, session_id)
+    requests = {
+        "e2e.status": (None, "/api/v1/status", None),
+        "e2e.basic_auth.get_user": (basic_auth, "/api/v1/users/" + user.id,
+                                    {"Authorization": header}),
+        "e2e.session_auth.me": (session_auth, "/api/v1/users/me", None)
+    }
+    for name, (auth, path, headers) in requests.items():
+        app_module.auth = auth
+        record(results, "{}[{}]".format(name, size),
+               lambda: client.get(path, headers=headers))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python3 bench.py")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)))
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    output_path = args.output and os.path.abspath(args.output)
+    baseline_path = args.baseline and os.path.abspath(args.baseline)
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+    os.environ.setdefault("SESSION_NAME", SESSION_NAME)
+    sys.path.insert(0, ROOT)
+    results = {}
+    try:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            run(size, results)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    report = {
+        "project": os.path.basename(ROOT),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results
+    }
+    output = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if baseline_path:
+        with open(baseline_path, 'r') as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print("regression: " + regression, file=sys.stderr)
+        if len(regressions) > 0:
+            sys.exit(1)
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+""" Columns module
+
+Run `python3 -m models.columns [count]` to compare the memory used by
+`count` users, and the cost of a lookup, in the default and in the
+compact storage modes.
+"""
+from array import array
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple, TypeVar
+import re
+import sys
+import threading
+import weakref
+
+
+EPOCH = datetime(1970, 1, 1)
+NO_TIMESTAMP = -(1 << 63)
+MISSING = object()
+
+# A span of a StringColumn is (offset << SPAN_BITS) | length of a packed
+# string in the heap, or one of these codes
+ABSENT = -1
+NULL = -2
+OBJECT = -3
+ROW_ID = -4
+SPAN_BITS = 20
+MAX_LENGTH = (1 << SPAN_BITS) - 1
+
+# Slots of the ID hash table of a ColumnStore hold a row number, or one of
+# these codes
+EMPTY = -1
+DELETED = -2
+
+UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-"
+                  r"[0-9a-f]{12}")
+HEX_DIGEST = re.compile(r"(?:[0-9a-f]{2}){16,}")
+
+
+def _to_epoch(value) -> int:
+    """ Seconds since EPOCH of a naive datetime (or of its JSON string,
+    or of the integer decoded from a binary snapshot)
+    """
+    if value is None:
+        return NO_TIMESTAMP
+    if type(value) is int:
+        return value
+    if type(value) is str:
+        value = datetime.fromisoformat(value)
+    return (value - EPOCH) // timedelta(seconds=1)
+
+
+def _from_epoch(value: int) -> datetime:
+    """ Naive datetime of seconds since EPOCH
+    """
+    if value == NO_TIMESTAMP:
+        return None
+    return EPOCH + timedelta(0, value)
+
+
+def pack(value: str) -> bytes:
+    """ Encode a string in a tagged byte string: canonical UUIDs (IDs) and
+    lowercase hex digests after an optional `$...$` prefix (password
+    hashes) as raw bytes, any other string as UTF-8
+    """
+    if len(value) == 36 and UUID.fullmatch(value):
+        return b"\x01" + bytes.fromhex(value.replace("-", ""))
+    start = value.rfind("$") + 1
+    if HEX_DIGEST.fullmatch(value, start):
+        prefix = value[:start].encode("utf-8", "surrogatepass")
+        if len(prefix) < 256:
+            return (b"\x02" + bytes((len(prefix),)) + prefix +
+                    bytes.fromhex(value[start:]))
+    return b"\x00" + value.encode("utf-8", "surrogatepass")
+
+
+def unpack(data: bytes) -> str:
+    """ Decode a byte string encoded by pack
+    """
+    tag = data[0]
+    if tag == 1:
+        h = data.hex()
+        return f"{h[2:10]}-{h[10:14]}-{h[14:18]}-{h[18:22]}-{h[22:]}"
+    if tag == 2:
+        end = 2 + data[1]
+        return (data[2:end].decode("utf-8", "surrogatepass") +
+                data[end:].hex())
+    return data[1:].decode("utf-8", "surrogatepass")
+
+
+class StringColumn():
+    """ Values of one attribute, indexed by row number
+
+    Strings are packed one after the other in a single byte heap, and
+    each row holds the span of its value (8 bytes) instead of a reference
+    to a str object. The space of overwritten values is reclaimed once it
+    is more than half of the heap. Values of other types are kept in a
+    dictionary of their rows.
+    """
+
+    def __init__(self, rows: int = 0):
+        """ Initialize a column of `rows` missing values
+        """
+        self.heap = bytearray()
+        self.spans = array('q', [ABSENT]) * rows
+        self.objects = {}
+        self.garbage = 0
+
+    def append(self):
+        """ Add a row, its value missing
+        """
+        self.spans.append(ABSENT)
+
+    def packed(self, row: int) -> bytes:
+        """ Packed string of `row`, None if its value is not a string
+        """
+        span = self.spans[row]
+        if span < 0:
+            return None
+        start = span >> SPAN_BITS
+        return bytes(self.heap[start:start + (span & MAX_LENGTH)])
+
+    def get(self, row: int, obj_id: str = None):
+        """ Value of `row` (MISSING if it has none), `obj_id` being the ID
+        of the object stored in the row
+        """
+        span = self.spans[row]
+        if span >= 0:
+            start = span >> SPAN_BITS
+            return unpack(self.heap[start:start + (span & MAX_LENGTH)])
+        if span == NULL:
+            return None
+        if span == OBJECT:
+            return self.objects[row]
+        if span == ROW_ID:
+            return obj_id
+        return MISSING
+
+    def set(self, row: int, value, obj_id: str = None):
+        """ Store the value of `row` (a value equal to `obj_id`, the ID of
+        the object stored in the row, is not stored twice)
+        """
+        self.clear(row)
+        if value is MISSING:
+            return
+        if value is None:
+            span = NULL
+        elif type(value) is str and value == obj_id:
+            span = ROW_ID
+        else:
+            data = pack(value) if type(value) is str else None
+            if data is None or len(data) > MAX_LENGTH:
+                self.objects[row] = value
+                span = OBJECT
+            else:
+                span = (len(self.heap) << SPAN_BITS) | len(data)
+                self.heap += data
+        self.spans[row] = span
+        if self.garbage > 4096 and self.garbage * 2 > len(self.heap):
+            self.compact()
+
+    def clear(self, row: int):
+        """ Remove the value of `row`
+        """
+        span = self.spans[row]
+        if span >= 0:
+            self.garbage += span & MAX_LENGTH
+        elif span == OBJECT:
+            del self.objects[row]
+        self.spans[row] = ABSENT
+
+    def compact(self):
+        """ Rewrite the heap without the overwritten values
+        """
+        heap = bytearray()
+        spans = self.spans
+        for row, span in enumerate(spans):
+            if span >= 0:
+                start, length = span >> SPAN_BITS, span & MAX_LENGTH
+                spans[row] = (len(heap) << SPAN_BITS) | length
+                heap += self.heap[start:start + length]
+        self.heap = heap
+        self.garbage = 0
+
+
+class ColumnStore(MutableMapping):
+    """ Objects of one class stored column by column
+
+    Used in place of DATA[<class>] when DB_STORAGE=compact. Each
+    attribute is a column indexed by row number: timestamps are kept as
+    64-bit integers in arrays, other values in StringColumns. Rows are
+    found by ID through an open-addressing hash table of row numbers, so
+    no Python object is kept per stored object.
+
+    Instances are built from their row when they are returned, and written
+    back when they are stored (Base.save). Built instances are remembered
+    as long as they are referenced elsewhere, so that, as with the default
+    storage, get() returns the same object while it is in use. Rows are
+    read and written under a lock, so that a reader never sees a
+    half-written row.
+    """
+
+    TIMESTAMPS = ('created_at', 'updated_at')
+
+    def __init__(self, cls: type, objs_json: dict = None):
+        """ Initialize the store, with raw JSON dictionaries if given
+        """
+        self._cls = cls
+        self._ids = StringColumn()
+        self._columns = {}
+        self._free = []
+        self._slots = array('q', [EMPTY]) * 8
+        self._used = 0
+        self._count = 0
+        self._instances = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        for obj_id, obj_json in (objs_json or {}).items():
+            self._write_row(obj_id, obj_json)
+
+    def _column(self, attr: str):
+        """ Column of `attr`, created (with every row missing) if needed
+        """
+        column = self._columns.get(attr)
+        if column is None:
+            rows = len(self._ids.spans)
+            if attr in self.TIMESTAMPS:
+                column = array('q', [NO_TIMESTAMP]) * rows
+            else:
+                column = StringColumn(rows)
+            self._columns[attr] = column
+        return column
+
+    def _find(self, obj_id: str) -> Tuple[int, int]:
+        """ Slot and row of `obj_id`; if it is not stored, the row is None
+        and the slot is the one to store it in
+        """
+        packed = pack(obj_id)
+        slots = self._slots
+        mask = len(slots) - 1
+        i = hash(obj_id) & mask
+        free = None
+        while True:
+            row = slots[i]
+            if row == EMPTY:
+                return (i if free is None else free), None
+            if row == DELETED:
+                if free is None:
+                    free = i
+            elif self._ids.packed(row) == packed:
+                return i, row
+            i = (i + 1) & mask
+
+    def _resize(self):
+        """ Rebuild the hash table, at most half full
+        """
+        size = 8
+        while size < 2 * (self._count + 1):
+            size *= 2
+        slots = array('q', [EMPTY]) * size
+        mask = size - 1
+        for row, span in enumerate(self._ids.spans):
+            if span == ABSENT:
+                continue
+            i = hash(self._ids.get(row)) & mask
+            while slots[i] != EMPTY:
+                i = (i + 1) & mask
+            slots[i] = row
+        self._slots = slots
+        self._used = self._count
+
+    def _write_row(self, obj_id: str, attrs: dict):
+        """ Store the attributes (instance __dict__ or JSON) of an object,
+        the lock being held
+        """
+        slot, row = self._find(obj_id)
+        if row is None:
+            if 3 * (self._used + 1) > 2 * len(self._slots):
+                self._resize()
+                slot, row = self._find(obj_id)
+            if self._free:
+                row = self._free.pop()
+            else:
+                row = len(self._ids.spans)
+                self._ids.append()
+                for column in self._columns.values():
+                    if type(column) is array:
+                        column.append(NO_TIMESTAMP)
+                    else:
+                        column.append()
+            self._ids.set(row, obj_id)
+            if self._slots[slot] == EMPTY:
+                self._used += 1
+            self._slots[slot] = row
+            self._count += 1
+        for attr, column in self._columns.items():
+            if attr not in attrs:
+                if type(column) is array:
+                    column[row] = NO_TIMESTAMP
+                else:
+                    column.clear(row)
+        for attr, value in attrs.items():
+            column = self._column(attr)
+            if type(column) is array:
+                column[row] = _to_epoch(value)
+            else:
+                column.set(row, value, obj_id)
+
+    def _read_row(self, row: int, obj_id: str) -> dict:
+        """ Attributes of the object `obj_id` stored in `row`, the lock
+        being held
+        """
+        attrs = {}
+        for attr, column in self._columns.items():
+            if type(column) is array:
+                attrs[attr] = _from_epoch(column[row])
+            else:
+                value = column.get(row, obj_id)
+                if value is not MISSING:
+                    attrs[attr] = value
+        return attrs
+
+    def __getitem__(self, obj_id: str) -> TypeVar('Base'):
+        """ Instance of `obj_id`, built from its row if it is not in use
+        """
+        with self._lock:
+            obj = self._instances.get(obj_id)
+            if obj is not None:
+                return obj
+            row = self._find(obj_id)[1]
+            if row is None:
+                raise KeyError(obj_id)
+            obj = self._cls.__new__(self._cls)
+            obj.__dict__.update(self._read_row(row, obj_id))
+            self._instances[obj_id] = obj
+            return obj
+
+    def __setitem__(self, obj_id: str, obj: TypeVar('Base')):
+        """ Store an instance
+        """
+        with self._lock:
+            self._write_row(obj_id, obj.__dict__)
+            self._instances[obj_id] = obj
+
+    def __delitem__(self, obj_id: str):
+        """ Free the row of `obj_id`
+        """
+        with self._lock:
+            slot, row = self._find(obj_id)
+            if row is None:
+                raise KeyError(obj_id)
+            self._slots[slot] = DELETED
+            self._count -= 1
+            self._ids.clear(row)
+            for column in self._columns.values():
+                if type(column) is array:
+                    column[row] = NO_TIMESTAMP
+                else:
+                    column.clear(row)
+            self._free.append(row)
+            self._instances.pop(obj_id, None)
+
+    def __contains__(self, obj_id) -> bool:
+        """ Whether `obj_id` is stored
+        """
+        if type(obj_id) is not str:
+            return False
+        with self._lock:
+            return self._find(obj_id)[1] is not None
+
+    def __iter__(self) -> Iterator[str]:
+        """ Iterate over the stored IDs
+        """
+        with self._lock:
+            ids = self._ids
+            return iter([ids.get(row) for row, span in enumerate(ids.spans)
+                         if span != ABSENT])
+
+    def __len__(self) -> int:
+        """ Number of stored objects
+        """
+        return self._count
+
+    def values(self) -> List[TypeVar('Base')]:
+        """ All instances
+        """
+        return [obj for obj_id, obj in self.items()]
+
+    def items(self) -> List[Tuple[str, TypeVar('Base')]]:
+        """ All (id, instance) pairs
+        """
+        items = []
+        for obj_id in list(self):
+            obj = self.get(obj_id)
+            if obj is not None:
+                items.append((obj_id, obj))
+        return items
+
+    def raw_items(self) -> Iterator[Tuple[str, dict]]:
+        """ All (id, JSON dictionary) pairs, without building instances
+        """
+        for obj_id in list(self):
+            with self._lock:
+                row = self._find(obj_id)[1]
+                if row is None:
+                    continue
+                obj_json = self._read_row(row, obj_id)
+            for attr in self.TIMESTAMPS:
+                if obj_json.get(attr) is not None:
+                    obj_json[attr] = obj_json[attr].isoformat(
+                        timespec='seconds')
+            yield obj_id, obj_json
+
+
+if __name__ == "__main__":
+    import gc
+    import random
+    import time
+    import tracemalloc
+    import uuid
+    from models.user import User
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    def build_users() -> dict:
+        """ JSON dictionaries of `count` users
+        """
+        now = datetime.utcnow().isoformat(timespec='seconds')
+        users = {}
+        for i in range(count):
+            obj_id = str(uuid.uuid4())
+            users[obj_id] = {
+                "id": obj_id, "created_at": now, "updated_at": now,
+                "email": "user{}@example.com".format(i),
+                "_password": "$sha256$" + uuid.uuid4().hex * 2,
+                "first_name": "First", "last_name": None}
+        return users
+
+    for mode in ("default", "compact"):
+        gc.collect()
+        tracemalloc.start()
+        objs_json = build_users()
+        obj_ids = random.sample(list(objs_json), min(count, 10000))
+        if mode == "default":
+            store = {k: User(**v) for k, v in objs_json.items()}
+        else:
+            store = ColumnStore(User, objs_json)
+        del objs_json
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        for obj_id in obj_ids:
+            store.get(obj_id)
+        lookup = (time.perf_counter() - start) / len(obj_ids)
+        print("{:<8} {:>10.1f} MB  {:>6.0f} bytes/user  {:>6.2f} us/get"
+              .format(mode, size / 1e6, size / count, lookup * 1e6))
+        del store
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+""" Lazy module
+"""
+from typing import Iterator, List, Tuple, TypeVar
+
+from models.snapshot import Record
+
+
+class LazyObjects(dict):
+    """ Objects of one class, kept as raw JSON dictionaries (or binary
+    snapshot records) and turned into instances on first access
+
+    Used in place of DATA[<class>] when DB_LAZY_LOAD=1, so that startup
+    only parses the file (only its index with DB_FORMAT=binary) and does
+    not build every object.
+    """
+
+    def __init__(self, cls: type, objs_json: dict):
+        """ Initialize the store with the raw JSON dictionaries
+        """
+        super().__init__(objs_json)
+        self._cls = cls
+
+    def _hydrate(self, key: str, value) -> TypeVar('Base'):
+        """ Return the instance stored under `key`, building it if needed
+        If another thread builds it at the same time, its instance wins
+        """
+        if type(value) is Record:
+            obj = self._cls(**value.load())
+        elif type(value) is dict:
+            obj = self._cls(**value)
+        else:
+            return value
+        current = dict.get(self, key)
+        if current is value:
+            dict.__setitem__(self, key, obj)
+            return obj
+        if current is None:
+            return obj
+        if type(current) is dict or type(current) is Record:
+            return self._hydrate(key, current)
+        return current
+
+    def __getitem__(self, key: str) -> TypeVar('Base'):
+        """ Instance stored under `key`
+        """
+        return self._hydrate(key, dict.__getitem__(self, key))
+
+    def get(self, key: str, default=None) -> TypeVar('Base'):
+        """ Instance stored under `key`, or `default`
+        """
+        value = dict.get(self, key)
+        if value is None:
+            return default
+        return self._hydrate(key, value)
+
+    def values(self) -> List[TypeVar('Base')]:
+        """ All instances (builds the missing ones)
+        """
+        return [value for key, value in self.items()]
+
+    def items(self) -> List[Tuple[str, TypeVar('Base')]]:
+        """ All (id, instance) pairs (builds the missing ones)
+        """
+        items = []
+        for key, value in list(dict.items(self)):
+            items.append((key, self._hydrate(key, value)))
+        return items
+
+    def raw_items(self) -> Iterator[Tuple[str, object]]:
+        """ All (id, instance or raw JSON dictionary) pairs, as stored
+        (snapshot records are decoded)
+        """
+        for key, value in list(dict.items(self)):
+            if type(value) is Record:
+                value = value.load()
+            yield key, value
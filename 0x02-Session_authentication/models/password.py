@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+""" Password module
+
+Password hashes are stored as prefix-tagged strings:
+    $sha256$<hex digest>
+    $scrypt$n=<n>,r=<r>,p=<p>$<base64 salt>$<base64 hash>
+    $bcrypt$<bcrypt hash>
+Untagged 64-character hex strings are legacy SHA256 hashes, kept as they
+are unless another scheme is configured.
+
+New hashes use PASSWORD_SCHEME (default: sha256) with PASSWORD_PARAMS
+(e.g. "n=16384,r=8,p=1" or "rounds=12"). If PASSWORD_TARGET_MS is set,
+the parameters are instead calibrated so that one verification takes
+about that long on this machine.
+
+Run `python3 -m models.password` to print the verify cost per scheme.
+"""
+from os import getenv
+from typing import Dict, Tuple
+import base64
+import hashlib
+import hmac
+import os
+import time
+
+from models.metrics import timed
+
+try:
+    import bcrypt
+except ImportError:
+    bcrypt = None
+
+
+SCRYPT_DEFAULTS = {"n": 16384, "r": 8, "p": 1}
+BCRYPT_DEFAULTS = {"rounds": 12}
+CALIBRATED = {}
+
+
+def _scrypt(pwd: bytes, salt: bytes, params: Dict[str, int]) -> bytes:
+    """ scrypt key derivation with enough memory allowed for `params`
+    """
+    n, r, p = params["n"], params["r"], params["p"]
+    return hashlib.scrypt(pwd, salt=salt, n=n, r=r, p=p, dklen=32,
+                          maxmem=256 * n * r + (1 << 20))
+
+
+def parse_params(value: str) -> Dict[str, int]:
+    """ Parse "k=v,k=v" into a dictionary of integers
+    """
+    params = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        k, v = item.split("=", 1)
+        params[k.strip()] = int(v)
+    return params
+
+
+def format_params(params: Dict[str, int]) -> str:
+    """ Format a dictionary of integers as "k=v,k=v"
+    """
+    return ",".join("{}={}".format(k, params[k]) for k in sorted(params))
+
+
+def split_hash(hashed: str) -> Tuple[str, str]:
+    """ Return the (scheme, payload) of a stored hash
+    """
+    if hashed.startswith("$") and "$" in hashed[1:]:
+        scheme, payload = hashed[1:].split("$", 1)
+        return scheme, payload
+    return "legacy", hashed
+
+
+def hash_params(hashed: str) -> Dict[str, int]:
+    """ Return the cost parameters of a stored hash
+    """
+    scheme, payload = split_hash(hashed)
+    if scheme == "scrypt":
+        return parse_params(payload.split("$", 1)[0])
+    if scheme == "bcrypt":
+        return {"rounds": int(payload.split("$")[2])}
+    return {}
+
+
+@timed("password.hash")
+def hash_password(pwd: str, scheme: str = None,
+                  params: Dict[str, int] = None) -> str:
+    """ Hash `pwd` with `scheme` (default: the configured one)
+    """
+    if scheme is None:
+        scheme, params = configured_scheme()
+    pwd_e = pwd.encode()
+    if scheme == "sha256":
+        return "$sha256$" + hashlib.sha256(pwd_e).hexdigest().lower()
+    if scheme == "scrypt":
+        params = dict(SCRYPT_DEFAULTS, **(params or {}))
+        salt = os.urandom(16)
+        return "$scrypt${}${}${}".format(
+            format_params(params),
+            base64.b64encode(salt).decode(),
+            base64.b64encode(_scrypt(pwd_e, salt, params)).decode())
+    if scheme == "bcrypt":
+        if bcrypt is None:
+            raise ValueError("bcrypt is not installed")
+        params = dict(BCRYPT_DEFAULTS, **(params or {}))
+        salt = bcrypt.gensalt(params["rounds"])
+        return "$bcrypt$" + bcrypt.hashpw(pwd_e, salt).decode()
+    raise ValueError("Unknown password scheme: {}".format(scheme))
+
+
+@timed("password.verify")
+def verify_password(pwd: str, hashed: str) -> bool:
+    """ Check `pwd` against a stored hash of any scheme
+    """
+    scheme, payload = split_hash(hashed)
+    pwd_e = pwd.encode()
+    if scheme in ("legacy", "sha256"):
+        digest = hashlib.sha256(pwd_e).hexdigest().lower()
+        return hmac.compare_digest(digest, payload.lower())
+    if scheme == "scrypt":
+        try:
+            params, salt, expected = payload.split("$")
+            derived = _scrypt(pwd_e, base64.b64decode(salt),
+                              parse_params(params))
+            return hmac.compare_digest(derived, base64.b64decode(expected))
+        except (ValueError, KeyError):
+            return False
+    if scheme == "bcrypt" and bcrypt is not None:
+        try:
+            return bcrypt.checkpw(pwd_e, payload.encode())
+        except ValueError:
+            return False
+    return False
+
+
+def needs_rehash(hashed: str) -> bool:
+    """ Whether a stored hash is not in the configured scheme, or has a
+    lower cost (scrypt `n`, bcrypt `rounds`) than configured
+    """
+    scheme, params = configured_scheme()
+    stored_scheme, payload = split_hash(hashed)
+    if stored_scheme == "legacy":
+        stored_scheme = "sha256"
+    if stored_scheme != scheme:
+        return True
+    if scheme == "scrypt":
+        cost = "n"
+        params = dict(SCRYPT_DEFAULTS, **params)
+    elif scheme == "bcrypt":
+        cost = "rounds"
+        params = dict(BCRYPT_DEFAULTS, **params)
+    else:
+        return False
+    return hash_params(hashed)[cost] < params[cost]
+
+
+def verify_cost(scheme: str, params: Dict[str, int] = None,
+                repeat: int = 3) -> float:
+    """ Average time in seconds of one verification
+    """
+    hashed = hash_password("benchmark", scheme, params)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        verify_password("benchmark", hashed)
+    return (time.perf_counter() - start) / repeat
+
+
+def calibrate(scheme: str, target: float) -> Dict[str, int]:
+    """ Cheapest parameters of `scheme` whose verification takes at least
+    `target` seconds (or the strongest tried)
+    """
+    if scheme == "scrypt":
+        params = dict(SCRYPT_DEFAULTS, n=1024)
+        while params["n"] < (1 << 20):
+            if verify_cost(scheme, params, 1) >= target:
+                break
+            params["n"] *= 2
+        return params
+    if scheme == "bcrypt":
+        params = {"rounds": 4}
+        while params["rounds"] < 16:
+            if verify_cost(scheme, params, 1) >= target:
+                break
+            params["rounds"] += 1
+        return params
+    return {}
+
+
+def configured_scheme() -> Tuple[str, Dict[str, int]]:
+    """ Scheme and parameters to use for new hashes
+    """
+    scheme = getenv("PASSWORD_SCHEME", "sha256")
+    target_ms = getenv("PASSWORD_TARGET_MS")
+    if target_ms:
+        key = (scheme, target_ms)
+        if key not in CALIBRATED:
+            CALIBRATED[key] = calibrate(scheme, float(target_ms) / 1000)
+        return scheme, CALIBRATED[key]
+    return scheme, parse_params(getenv("PASSWORD_PARAMS"))
+
+
+if __name__ == "__main__":
+    benchmarks = [
+        ("sha256", {}),
+        ("scrypt", {"n": 1024, "r": 8, "p": 1}),
+        ("scrypt", SCRYPT_DEFAULTS),
+    ]
+    if bcrypt is not None:
+        benchmarks += [("bcrypt", {"rounds": 10}),
+                       ("bcrypt", BCRYPT_DEFAULTS)]
+    for scheme, params in benchmarks:
+        cost = verify_cost(scheme, params, 1000 if scheme == "sha256" else 5)
+        print("{:<8} {:<22} {:>12.3f} ms/verify".format(
+            scheme, format_params(params), cost * 1000))
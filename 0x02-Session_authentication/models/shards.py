@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+""" Shards module
+
+With DB_SHARDS=<n> (n > 1), the objects of a class are split into n
+shards by a hash of their ID, each one persisted to its own file
+`.db_<Class>.<shard>.json`, so that a save only rewrites one shard.
+
+Run `python3 -m models.shards <Class> <n>` (with the API stopped) to
+split the files of a class into n shards, or to merge them back into
+`.db_<Class>.json` with n = 1 (`.bin` files with DB_FORMAT=binary).
+"""
+from collections.abc import MutableMapping
+from itertools import chain
+from typing import Iterator, List, Tuple, TypeVar
+import glob
+import json
+import os
+import re
+import zlib
+
+from models import snapshot
+
+
+def shard_of(obj_id: str, shards: int) -> int:
+    """ Shard of the ID `obj_id` among `shards` shards
+    The hash is stable across processes (unlike hash())
+    """
+    if shards <= 1:
+        return 0
+    return zlib.crc32(obj_id.encode('utf-8')) % shards
+
+
+def shard_path(s_class: str, shard: int, shards: int,
+               extension: str = "json") -> str:
+    """ File of a shard of the class `s_class`
+    """
+    if shards <= 1:
+        return ".db_{}.{}".format(s_class, extension)
+    return ".db_{}.{}.{}".format(s_class, shard, extension)
+
+
+class ShardedObjects(MutableMapping):
+    """ Objects of one class split into shards
+
+    Used in place of DATA[<class>] when DB_SHARDS > 1. Each shard is a
+    mapping of its own (dict, ColumnStore or LazyObjects): lookups by ID
+    go to one shard, iterations go through all of them.
+    """
+
+    def __init__(self, shards: List[MutableMapping]):
+        """ Initialize the store with one mapping per shard
+        """
+        self.shards = shards
+
+    def shard(self, obj_id: str) -> MutableMapping:
+        """ Mapping of the shard of `obj_id`
+        """
+        return self.shards[shard_of(obj_id, len(self.shards))]
+
+    def __getitem__(self, obj_id: str) -> TypeVar('Base'):
+        """ Instance stored under `obj_id`
+        """
+        return self.shard(obj_id)[obj_id]
+
+    def get(self, obj_id: str, default=None) -> TypeVar('Base'):
+        """ Instance stored under `obj_id`, or `default`
+        """
+        return self.shard(obj_id).get(obj_id, default)
+
+    def __setitem__(self, obj_id: str, obj: TypeVar('Base')):
+        """ Store an instance
+        """
+        self.shard(obj_id)[obj_id] = obj
+
+    def __delitem__(self, obj_id: str):
+        """ Remove an instance
+        """
+        del self.shard(obj_id)[obj_id]
+
+    def __contains__(self, obj_id) -> bool:
+        """ Whether `obj_id` is stored
+        """
+        return obj_id in self.shard(obj_id)
+
+    def __iter__(self) -> Iterator[str]:
+        """ Iterate over the stored IDs, shard by shard
+        """
+        return chain.from_iterable(list(shard) for shard in self.shards)
+
+    def __len__(self) -> int:
+        """ Number of stored objects
+        """
+        return sum(len(shard) for shard in self.shards)
+
+    def values(self) -> List[TypeVar('Base')]:
+        """ All instances
+        """
+        return [obj for shard in self.shards for obj in shard.values()]
+
+    def items(self) -> List[Tuple[str, TypeVar('Base')]]:
+        """ All (id, instance) pairs
+        """
+        return [item for shard in self.shards for item in shard.items()]
+
+    def raw_items(self, shards: List[int] = None) -> Iterator[Tuple[str,
+                                                                    object]]:
+        """ (id, instance or JSON dictionary) pairs of some shards (all by
+        default), as stored
+        """
+        if shards is None:
+            shards = range(len(self.shards))
+        for i in shards:
+            shard = self.shards[i]
+            if hasattr(shard, 'raw_items'):
+                yield from shard.raw_items()
+            else:
+                yield from list(shard.items())
+
+
+def rebalance(s_class: str, shards: int, binary: bool = False) -> int:
+    """ Rewrite the files (binary snapshots if `binary`) of the class
+    `s_class` into `shards` shards
+    Return the number of objects
+    """
+    extension = "bin" if binary else "json"
+    pattern = re.compile(r"\.db_{}(\.\d+)?\.{}$".format(
+        re.escape(s_class), extension))
+    old_paths = [p for p in glob.glob(".db_{}*.{}".format(s_class, extension))
+                 if pattern.search(p)]
+    objs_json = {}
+    indexed_attributes = {}
+    for path in old_paths:
+        if binary:
+            snap = snapshot.Snapshot(path)
+            objs_json.update(snap.read_all())
+            indexed_attributes.update(dict.fromkeys(snap.indexed))
+        else:
+            with open(path, 'r') as f:
+                objs_json.update(json.load(f))
+    split = [{} for i in range(max(shards, 1))]
+    for obj_id, obj_json in objs_json.items():
+        split[shard_of(obj_id, shards)][obj_id] = obj_json
+    new_paths = []
+    for i, shard_json in enumerate(split):
+        path = shard_path(s_class, i, shards, extension)
+        with open(path + ".tmp", 'wb' if binary else 'w') as f:
+            if binary:
+                snapshot.dump(f, shard_json, indexed_attributes)
+            else:
+                json.dump(shard_json, f)
+        os.replace(path + ".tmp", path)
+        new_paths.append(path)
+    for path in old_paths:
+        if path not in new_paths:
+            os.remove(path)
+    return len(objs_json)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("Usage: python3 -m models.shards <Class> <shards>")
+        sys.exit(1)
+    count = rebalance(sys.argv[1], int(sys.argv[2]),
+                      os.getenv("DB_FORMAT", "json") == "binary")
+    print("{} objects in {} shard(s)".format(count, int(sys.argv[2])))
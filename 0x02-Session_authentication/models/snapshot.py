@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+""" Snapshot module
+
+Binary file format used instead of JSON when DB_FORMAT=binary:
+
+- header: magic `DBS1`, number of records (uint32) and offset of the
+  index (uint64)
+- records: length (uint32) and compact JSON array of the values of one
+  object, timestamps being integers (seconds since the epoch), then the
+  number of its shape (list of keys)
+- index: length (uint32) and JSON object of the shapes, the IDs and the
+  values of the indexed attributes, then the offset of each record
+  (uint64 array)
+
+The file is read through mmap: opening it only parses the index, and a
+single record can be decoded without reading the others. Decoded
+timestamps are left as integers, which Base and ColumnStore accept
+(`format_timestamps` turns them back into strings).
+
+Run `python3 -m models.snapshot to-binary .db_User.json .db_User.bin
+[--index email]` or `python3 -m models.snapshot to-json .db_User.bin
+.db_User.json` to convert a file.
+"""
+from array import array
+from datetime import datetime, timedelta
+from typing import BinaryIO, Dict, Iterable, List
+import json
+import mmap
+import os
+import struct
+import sys
+
+from models.serializer import dumps
+
+
+MAGIC = b"DBS1"
+HEADER = struct.Struct("<4sIQ")
+LENGTH = struct.Struct("<I")
+TIMESTAMPS = ('created_at', 'updated_at')
+EPOCH = datetime(1970, 1, 1)
+
+
+def _to_epoch(value: str) -> int:
+    """ Seconds since EPOCH of a TIMESTAMP_FORMAT string
+    """
+    return (datetime.fromisoformat(value) - EPOCH) // timedelta(seconds=1)
+
+
+def _from_epoch(value: int) -> str:
+    """ TIMESTAMP_FORMAT string of seconds since EPOCH
+    """
+    return (EPOCH + timedelta(seconds=value)).isoformat(timespec='seconds')
+
+
+def format_timestamps(obj_json: dict) -> dict:
+    """ Turn the integer timestamps of a decoded record back into
+    TIMESTAMP_FORMAT strings, in place
+    """
+    for key in TIMESTAMPS:
+        if type(obj_json.get(key)) is int:
+            obj_json[key] = _from_epoch(obj_json[key])
+    return obj_json
+
+
+def _is_timestamp(value) -> bool:
+    """ Whether `value` is a string written by Serializer.timestamp
+    """
+    return type(value) is str and len(value) == 19 and value[10] == 'T'
+
+
+def dump(f: BinaryIO, objs_json: Dict[str, dict],
+         indexed_attributes: Iterable[str] = ()):
+    """ Write `objs_json` (id -> JSON dictionary) to the binary file `f`,
+    keeping the values of `indexed_attributes` in the index
+    """
+    indexed_attributes = tuple(indexed_attributes)
+    shapes = {}
+    ids = []
+    offsets = array('Q')
+    indexed = {attr: [] for attr in indexed_attributes}
+    f.write(HEADER.pack(MAGIC, 0, 0))
+    offset = HEADER.size
+    for obj_id, obj_json in objs_json.items():
+        keys = tuple(obj_json)
+        shape = shapes.setdefault(keys, len(shapes))
+        values = []
+        for key in keys:
+            value = obj_json[key]
+            if key in TIMESTAMPS and _is_timestamp(value):
+                value = _to_epoch(value)
+            values.append(value)
+        values.append(shape)
+        payload = dumps(values)
+        f.write(LENGTH.pack(len(payload)))
+        f.write(payload)
+        ids.append(obj_id)
+        offsets.append(offset)
+        offset += LENGTH.size + len(payload)
+        for attr in indexed_attributes:
+            indexed[attr].append(obj_json.get(attr))
+    index = dumps({"shapes": list(shapes), "ids": ids, "indexed": indexed})
+    f.write(LENGTH.pack(len(index)))
+    f.write(index)
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    f.write(offsets.tobytes())
+    f.seek(0)
+    f.write(HEADER.pack(MAGIC, len(ids), offset))
+    f.seek(0, os.SEEK_END)
+
+
+class Record():
+    """ Reference to one record of a snapshot, decoded on demand
+
+    `get` returns indexed attributes from the index, so that records can
+    be indexed without being decoded.
+    """
+
+    __slots__ = ('snapshot', 'row')
+
+    def __init__(self, snapshot: 'Snapshot', row: int):
+        """ Initialize a reference to the record number `row`
+        """
+        self.snapshot = snapshot
+        self.row = row
+
+    def get(self, attr: str, default=None):
+        """ Value of `attr`
+        """
+        values = self.snapshot.indexed.get(attr)
+        if values is not None:
+            return values[self.row]
+        return self.load().get(attr, default)
+
+    def load(self) -> dict:
+        """ JSON dictionary of the record
+        """
+        return self.snapshot.read_row(self.row)
+
+
+class Snapshot():
+    """ Binary snapshot file opened through mmap
+    """
+
+    def __init__(self, file_path: str):
+        """ Open `file_path` and parse its index
+        Raise ValueError if it is not a snapshot
+        """
+        with open(file_path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            if self.stat.st_size == 0:
+                raise ValueError("{} is empty".format(file_path))
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, index_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not a snapshot".format(file_path))
+        length, = LENGTH.unpack_from(self._map, index_offset)
+        start = index_offset + LENGTH.size
+        index = json.loads(self._map[start:start + length])
+        self.shapes = [tuple(shape) for shape in index["shapes"]]
+        self.ids = index["ids"]
+        self.indexed = index["indexed"]
+        self.offsets = array('Q')
+        self.offsets.frombytes(self._map[start + length:
+                                         start + length + 8 * count])
+        if sys.byteorder != 'little':
+            self.offsets.byteswap()
+        self._rows = None
+
+    def __len__(self) -> int:
+        """ Number of records
+        """
+        return len(self.ids)
+
+    def _payload(self, row: int) -> bytes:
+        """ Encoded values of the record number `row`
+        """
+        offset = self.offsets[row]
+        length, = LENGTH.unpack_from(self._map, offset)
+        start = offset + LENGTH.size
+        return self._map[start:start + length]
+
+    def read_row(self, row: int) -> dict:
+        """ JSON dictionary of the record number `row`
+        """
+        values = json.loads(self._payload(row))
+        return dict(zip(self.shapes[values.pop()], values))
+
+    def read(self, obj_id: str) -> dict:
+        """ JSON dictionary of the object `obj_id`, None if it is missing
+        """
+        if self._rows is None:
+            self._rows = {obj_id: row for row, obj_id in enumerate(self.ids)}
+        row = self._rows.get(obj_id)
+        if row is None:
+            return None
+        return self.read_row(row)
+
+    def records(self) -> Dict[str, Record]:
+        """ All objects as references to their records
+        """
+        return {obj_id: Record(self, row)
+                for row, obj_id in enumerate(self.ids)}
+
+    def read_all(self) -> Dict[str, dict]:
+        """ All objects as JSON dictionaries
+        The records are decoded by a single json.loads call
+        """
+        rows = json.loads(b"[" + b",".join(
+            [self._payload(row) for row in range(len(self.ids))]) + b"]")
+        shapes = self.shapes
+        return {obj_id: dict(zip(shapes[values.pop()], values))
+                for obj_id, values in zip(self.ids, rows)}
+
+
+def convert(source: str, destination: str, to_binary: bool,
+            indexed_attributes: List[str] = ()) -> int:
+    """ Convert the JSON file `source` to the binary `destination`, or the
+    other way around
+    Return the number of objects
+    """
+    if to_binary:
+        with open(source, 'r') as f:
+            objs_json = json.load(f)
+    else:
+        objs_json = Snapshot(source).read_all()
+        for obj_json in objs_json.values():
+            format_timestamps(obj_json)
+    tmp_path = "{}.tmp".format(destination)
+    with open(tmp_path, 'wb' if to_binary else 'w') as f:
+        if to_binary:
+            dump(f, objs_json, indexed_attributes)
+        else:
+            json.dump(objs_json, f)
+    os.replace(tmp_path, destination)
+    return len(objs_json)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python3 -m models.snapshot")
+    parser.add_argument("direction", choices=("to-binary", "to-json"))
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("--index", default="",
+                        help="attributes kept in the index, e.g. email")
+    args = parser.parse_args()
+
+    indexed_attributes = [attr for attr in args.index.split(",") if attr]
+    count = convert(args.source, args.destination,
+                    args.direction == "to-binary", indexed_attributes)
+    print("{} objects converted".format(count))
@@ -1,14 +1,16 @@
 #!/usr/bin/env python3
 """ User module
 """
-import hashlib
-from models.base import Base
+from models.base import Base, DATA
+from models.password import hash_password, needs_rehash, verify_password
 
 
 class User(Base):
     """ User class
     """
 
+    indexed_attributes = ('email',)
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
@@ -26,22 +28,29 @@ class User(Base):
 
     @password.setter
     def password(self, pwd: str):
-        """ Setter of a new password: encrypt in SHA256
+        """ Setter of a new password: hash it with the configured scheme
         """
         if pwd is None or type(pwd) is not str:
             self._password = None
         else:
-            self._password = hashlib.sha256(pwd.encode()).hexdigest().lower()
+            self._password = hash_password(pwd)
 
     def is_valid_password(self, pwd: str) -> bool:
         """ Validate a password
+        A stored user whose hash is not in the configured scheme is
+        rehashed and saved on success
         """
         if pwd is None or type(pwd) is not str:
             return False
         if self.password is None:
             return False
-        pwd_e = pwd.encode()
-        return hashlib.sha256(pwd_e).hexdigest().lower() == self.password
+        if not verify_password(pwd, self.password):
+            return False
+        stored = self.id in DATA.get(self.__class__.__name__, {})
+        if stored and needs_rehash(self.password):
+            self.password = pwd
+            self.save()
+        return True
 
     def display_name(self) -> str:
         """ Display User name based on email/first_name/last_name
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+""" Tests of the password rehash on login
+"""
+import hashlib
+
+import pytest
+
+from models.user import User
+
+
+@pytest.fixture
+def legacy_user(tmp_path, monkeypatch):
+    """ Stored user whose password is an untagged SHA256 hex digest
+    """
+    monkeypatch.chdir(tmp_path)
+    for name in ("PASSWORD_SCHEME", "PASSWORD_PARAMS", "PASSWORD_TARGET_MS"):
+        monkeypatch.delenv(name, raising=False)
+    User.load_from_file()
+    user = User(email="bob@hbtn.io",
+                _password=hashlib.sha256(b"H0lb3rton").hexdigest())
+    user.save()
+    saves = []
+    monkeypatch.setattr(User, "save", lambda self: saves.append(self.id))
+    return user, saves
+
+
+def test_default_login_does_not_rehash(legacy_user):
+    """ With the default settings, a login keeps a legacy hash unwritten
+    """
+    user, saves = legacy_user
+    legacy = user.password
+    assert user.is_valid_password("H0lb3rton")
+    assert user.password == legacy
+    assert saves == []
+
+
+def test_login_rehashes_to_configured_scheme(legacy_user, monkeypatch):
+    """ With another scheme configured, a login rehashes and saves
+    """
+    user, saves = legacy_user
+    monkeypatch.setenv("PASSWORD_SCHEME", "scrypt")
+    monkeypatch.setenv("PASSWORD_PARAMS", "n=1024")
+    assert user.is_valid_password("H0lb3rton")
+    assert user.password.startswith("$scrypt$")
+    assert saves == [user.id]
@@ -12,9 +12,41 @@ from flask import (
 )
 
 from auth import Auth
+from hashing import HashingBusyError
+from rate_limit import rate_limiter_from_env
 
 app = Flask(__name__)
 AUTH = Auth()
+RATE_LIMITER = rate_limiter_from_env()
+
+
+@app.teardown_request
+def teardown_request(exception=None) -> None:
+    """
+    Release the database session of the request
+    """
+    AUTH.end_request()
+
+
+@app.errorhandler(HashingBusyError)
+def hashing_busy(error) -> str:
+    """
+    Refuse the request while the password hashing queue is full
+    """
+    resp = jsonify({"message": "service busy"})
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
+
+
+@app.errorhandler(429)
+def too_many_requests(error) -> str:
+    """
+    Refuse the request while its rate-limit buckets are empty
+    """
+    resp = jsonify({"message": "too many requests"})
+    if RATE_LIMITER is not None:
+        resp.headers["Retry-After"] = str(RATE_LIMITER.retry_after)
+    return resp, 429
 
 
 @app.route("/", methods=["GET"], strict_slashes=False)
@@ -45,12 +77,31 @@ def login() -> str:
     """
     Log in a user, and create a new
     session for them.
+    Failed attempts are rate limited per client IP and per email,
+    before the password is checked; attempts refused because the hashing
+    queue is full are not counted.
     """
     email = request.form.get("email")
     password = request.form.get("password")
 
-    if not AUTH.valid_login(email, password):
+    keys = []
+    if RATE_LIMITER is not None:
+        if request.remote_addr:
+            keys.append("ip:" + request.remote_addr)
+        if email is not None:
+            keys.append("email:" + email)
+        if not RATE_LIMITER.acquire(keys):
+            abort(429)
+    try:
+        valid = AUTH.valid_login(email, password)
+    except HashingBusyError:
+        if RATE_LIMITER is not None:
+            RATE_LIMITER.release(keys)
+        raise
+    if not valid:
         abort(401)
+    if RATE_LIMITER is not None:
+        RATE_LIMITER.release(keys)
 
     session_id = AUTH.create_session(email)
     resp = jsonify({"email": f"{email}", "message": "logged in"})
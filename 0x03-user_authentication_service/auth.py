@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 """
-Definition of _hash_password function
+Auth class, the authentication logic of the service
 """
+import os
 import bcrypt
 from uuid import uuid4
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 from typing import (
     TypeVar,
@@ -11,6 +13,7 @@ from typing import (
 )
 
 from db import DB
+from hashing import HashingService
 from user import User
 
 U = TypeVar(User)
@@ -18,10 +21,13 @@ U = TypeVar(User)
 
 def _hash_password(password: str) -> bytes:
     """
-    Hashes a password string and returns it in bytes form
+    Hashes a password string with BCRYPT_ROUNDS (12) rounds and returns
+    it in bytes form. Auth hashes through its HashingService instead, so
+    that requests do not block on bcrypt
     """
     passwd = password.encode('utf-8')
-    return bcrypt.hashpw(passwd, bcrypt.gensalt())
+    rounds = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    return bcrypt.hashpw(passwd, bcrypt.gensalt(rounds))
 
 
 def _generate_uuid() -> str:
@@ -37,6 +43,13 @@ class Auth:
 
     def __init__(self) -> None:
         self._db = DB()
+        self._hasher = HashingService()
+
+    def end_request(self) -> None:
+        """
+        Release the database session used while handling a request
+        """
+        self._db.remove_session()
 
     def register_user(self, email: str, password: str) -> User:
         """
@@ -45,9 +58,11 @@ class Auth:
         try:
             self._db.find_user_by(email=email)
         except NoResultFound:
-            hashed = _hash_password(password)
-            usr = self._db.add_user(email, hashed)
-            return usr
+            hashed = self._hasher.hash(password)
+            try:
+                return self._db.add_user(email, hashed)
+            except IntegrityError:
+                pass
         raise ValueError(f"User {email} already exists")
 
     def valid_login(self, email: str, password: str) -> bool:
@@ -59,9 +74,7 @@ class Auth:
         except NoResultFound:
             return False
 
-        user_password = user.hashed_password
-        passwd = password.encode("utf-8")
-        return bcrypt.checkpw(passwd, user_password)
+        return self._hasher.check(password, user.hashed_password)
 
     def create_session(self, email: str) -> Union[None, str]:
         """
@@ -122,5 +135,5 @@ class Auth:
         except NoResultFound:
             raise ValueError()
 
-        hashed = _hash_password(password)
+        hashed = self._hasher.hash(password)
         self._db.update_user(user.id, hashed_password=hashed, reset_token=None)
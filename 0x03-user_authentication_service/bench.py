@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the authentication hot paths
+
+    python3 bench.py [--sizes 1000,100000,1000000] [--output results.json]
+                     [--baseline baseline.json] [--threshold 1.25]
+
+Everything runs offline, against a new SQLite database of each size in a
+temporary directory. Results are printed (or written to --output) as
+JSON: number of runs, mean, median and 99th percentile per call, in
+microseconds. With --baseline (a previous output), the command fails if
+the mean of a benchmark grew by more than --threshold times.
+Password checks use bcrypt with BCRYPT_ROUNDS (default: 12).
+"""
+from typing import Callable, Dict, List
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SIZES = (1000, 100000, 1000000)
+PASSWORD = "b4l0u"
+INSERT_CHUNK_SIZE = 10000
+MIN_TIME = 0.2
+MIN_RUNS = 3
+MAX_RUNS = 100000
+
+
+def measure(func: Callable[[], object]) -> Dict[str, float]:
+    """
+    Call `func` at least MIN_RUNS times and for MIN_TIME seconds
+    Return the number of runs and the mean, median and 99th percentile
+    durations in microseconds
+    """
+    times = []
+    start = time.perf_counter()
+    while len(times) < MAX_RUNS and (
+            len(times) < MIN_RUNS or time.perf_counter() - start < MIN_TIME):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    times.sort()
+    return {
+        "runs": len(times),
+        "mean_us": round(sum(times) / len(times) * 1e6, 3),
+        "p50_us": round(times[len(times) // 2] * 1e6, 3),
+        "p99_us": round(times[min(len(times) - 1,
+                                  int(len(times) * 0.99))] * 1e6, 3)
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Benchmarks whose mean exceeds `threshold` times the baseline one
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None or base["mean_us"] <= 0:
+            continue
+        ratio = result["mean_us"] / base["mean_us"]
+        if ratio > threshold:
+            regressions.append("{}: {:.1f}us -> {:.1f}us (x{:.2f})".format(
+                name, base["mean_us"], result["mean_us"], ratio))
+    return regressions
+
+
+def record(results: dict, name: str, func: Callable[[], object]):
+    """
+    Measure `func` into `results`, reporting progress on stderr
+    """
+    results[name] = measure(func)
+    print("{}: {}".format(name, results[name]), file=sys.stderr)
+
+
+def populate(auth, count: int):
+    """
+    Insert `count` users sharing the same password, in large batches
+    """
+    from sqlalchemy import insert
+    from user import User
+
+    hashed = auth._hasher.hash(PASSWORD)
+    session = auth._db._session
+    for start in range(0, count, INSERT_CHUNK_SIZE):
+        end = min(count, start + INSERT_CHUNK_SIZE)
+        session.execute(insert(User), [
+            {"email": "user{}@example.com".format(i),
+             "hashed_password": hashed,
+             "session_id": "session-{}".format(i)}
+            for i in range(start, end)])
+    session.commit()
+
+
+def run(size: int, results: dict):
+    """
+    Run every benchmark against a new database of `size` users
+    """
+    import app as app_module
+    from auth import Auth
+
+    os.chdir(tempfile.mkdtemp(dir=os.getcwd()))
+    app_module.AUTH._hasher.shutdown()
+    auth = app_module.AUTH = Auth()
+    populate(auth, size)
+    email = "user{}@example.com".format(size // 2)
+    session_id = "session-{}".format(size // 2)
+    db = auth._db
+
+    benchmarks = {
+        "db.find_user_by_email": lambda: db.find_user_by(email=email),
+        "db.find_user_by_session_id": lambda: db.find_user_by(
+            session_id=session_id),
+        "auth.valid_login": lambda: auth.valid_login(email, PASSWORD),
+        "auth.get_user_from_session_id": lambda: (
+            auth.get_user_from_session_id(session_id))
+    }
+    for name, func in benchmarks.items():
+        record(results, "{}[{}]".format(name, size), func)
+    auth.end_request()
+
+    client = app_module.app.test_client()
+    record(results, "e2e.login[{}]".format(size), lambda: client.post(
+        "/sessions", data={"email": email, "password": PASSWORD}))
+    client.set_cookie("session_id", auth.create_session(email))
+    auth.end_request()
+    record(results, "e2e.profile[{}]".format(size),
+           lambda: client.get("/profile"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python3 bench.py")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)))
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    output_path = args.output and os.path.abspath(args.output)
+    baseline_path = args.baseline and os.path.abspath(args.baseline)
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+    sys.path.insert(0, ROOT)
+    results = {}
+    try:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            run(size, results)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    report = {
+        "project": os.path.basename(ROOT),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "bcrypt_rounds": int(os.getenv("BCRYPT_ROUNDS", "12")),
+        "results": results
+    }
+    output = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if baseline_path:
+        with open(baseline_path, 'r') as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print("regression: " + regression, file=sys.stderr)
+        if len(regressions) > 0:
+            sys.exit(1)
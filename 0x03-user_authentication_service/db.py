@@ -2,37 +2,107 @@
 """
 DB module.
 """
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm.session import Session
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.exc import DBAPIError, IntegrityError, InvalidRequestError
 
+from migrations import migrate
 from user import Base, User
 
 
+def _create_engine(url: str) -> Engine:
+    """
+    Create the engine for `url`, pooled according to DB_POOL_SIZE and
+    DB_MAX_OVERFLOW. SQLite connections are shared across threads and
+    switched to WAL journaling.
+    """
+    kwargs = {}
+    is_sqlite = url.startswith("sqlite")
+    if is_sqlite:
+        kwargs["connect_args"] = {"check_same_thread": False}
+    if not (is_sqlite and url in ("sqlite://", "sqlite:///:memory:")):
+        kwargs["pool_size"] = int(os.getenv("DB_POOL_SIZE", "5"))
+        kwargs["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    engine = create_engine(url, echo=False, **kwargs)
+    if is_sqlite:
+        @event.listens_for(engine, "connect")
+        def _sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA busy_timeout=5000")
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+    return engine
+
+
 class DB:
     """DB class
     """
 
     def __init__(self) -> None:
         """new DB instance
+        The database is reset, unless DB_PERSISTENT=1: then only missing
+        tables and indexes are created and pending migrations are applied
+        """
+        self._engine = _create_engine(os.getenv("DB_URL", "sqlite:///a.db"))
+        if os.getenv("DB_PERSISTENT", "0") == "1":
+            self._upgrade_schema()
+            self._warm_pool()
+        else:
+            Base.metadata.drop_all(self._engine)
+            Base.metadata.create_all(self._engine)
+        self.__session = scoped_session(
+            sessionmaker(bind=self._engine, expire_on_commit=False))
+
+    def _upgrade_schema(self) -> None:
+        """
+        Create the missing tables and indexes and apply the pending
+        migrations in a single transaction. On SQLite it takes the write
+        lock up front (BEGIN IMMEDIATE), so that workers starting together
+        on a new database upgrade it one after the other; on other
+        databases, a worker that loses the race retries once the winner
+        has committed
+        """
+        for attempt in range(3):
+            try:
+                with self._engine.connect() as conn:
+                    if self._engine.dialect.name == "sqlite":
+                        conn.exec_driver_sql("BEGIN IMMEDIATE")
+                    Base.metadata.create_all(conn)
+                    migrate(conn)
+                    conn.commit()
+                return
+            except DBAPIError:
+                if attempt == 2:
+                    raise
+
+    def _warm_pool(self) -> None:
+        """
+        Open the pooled connections up front, so that the first requests
+        do not pay for them
         """
-        self._engine = create_engine("sqlite:///a.db",
-                                     echo=False)
-        Base.metadata.drop_all(self._engine)
-        Base.metadata.create_all(self._engine)
-        self.__session = None
+        size = getattr(self._engine.pool, "size", lambda: 1)()
+        connections = [self._engine.connect() for _ in range(size)]
+        for connection in connections:
+            connection.close()
 
     @property
     def _session(self) -> Session:
-        """Memoized session
+        """Session of the current thread
+        """
+        return self.__session()
+
+    def remove_session(self) -> None:
         """
-        if self.__session is None:
-            DBSession = sessionmaker(bind=self._engine)
-            self.__session = DBSession()
-        return self.__session
+        Close the session of the current thread, giving its connection
+        back to the pool
+        """
+        self.__session.remove()
 
     def add_user(self, email: str, hashed_password: str) -> User:
         """
@@ -40,7 +110,11 @@ class DB:
         """
         user = User(email=email, hashed_password=hashed_password)
         self._session.add(user)
-        self._session.commit()
+        try:
+            self._session.commit()
+        except IntegrityError:
+            self._session.rollback()
+            raise
         return user
 
     def find_user_by(self, **kwargs) -> User:
@@ -48,14 +122,15 @@ class DB:
         Return a user who has an attribute matching the attributes passed
         as arguments
         """
-        all_users = self._session.query(User)
-        for k, v in kwargs.items():
+        if not kwargs:
+            raise NoResultFound
+        for k in kwargs:
             if k not in User.__dict__:
                 raise InvalidRequestError
-            for usr in all_users:
-                if getattr(usr, k) == v:
-                    return usr
-        raise NoResultFound
+        usr = self._session.query(User).filter_by(**kwargs).first()
+        if usr is None:
+            raise NoResultFound
+        return usr
 
     def update_user(self, user_id: int, **kwargs) -> None:
         """
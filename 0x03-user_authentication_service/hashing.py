@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Password hashing service running bcrypt in a bounded process pool
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+import bcrypt
+
+
+class HashingBusyError(Exception):
+    """
+    Raised when the hashing queue is full
+    """
+
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    """
+    Hash `password` with a new salt of cost `rounds`
+    """
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password: bytes, hashed_password: bytes) -> bool:
+    """
+    Check `password` against a bcrypt hash
+    """
+    return bcrypt.checkpw(password, hashed_password)
+
+
+class HashingService:
+    """
+    Run bcrypt outside of the request threads.
+
+    Calls are executed in a pool of `workers` processes, so that hashing
+    uses every core instead of contending for the GIL. At most
+    `max_pending` calls may be queued or running: beyond that, a call
+    fails at once with HashingBusyError instead of waiting. With 0
+    workers, bcrypt runs inline in the calling thread (still bounded).
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None,
+                 rounds: int = None) -> None:
+        """
+        Defaults come from HASH_WORKERS (number of CPUs),
+        HASH_QUEUE_SIZE (4 per worker) and BCRYPT_ROUNDS (12)
+        """
+        if workers is None:
+            workers = int(os.getenv("HASH_WORKERS", os.cpu_count() or 1))
+        if max_pending is None:
+            max_pending = int(os.getenv("HASH_QUEUE_SIZE",
+                                        max(workers, 1) * 4))
+        if rounds is None:
+            rounds = int(os.getenv("BCRYPT_ROUNDS", "12"))
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _run(self, fn: Callable, *args):
+        """
+        Run a call in the pool and return its result, or raise
+        HashingBusyError if too many calls are pending
+        """
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusyError("hashing queue is full")
+        if self.workers <= 0:
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+        try:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(self.workers)
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future.result()
+
+    def hash(self, password: str) -> bytes:
+        """
+        Hash a password string and returns it in bytes form
+        """
+        return self._run(_hashpw, password.encode('utf-8'), self.rounds)
+
+    def check(self, password: str, hashed_password: bytes) -> bool:
+        """
+        Check a password string against its bcrypt hash
+        """
+        return self._run(_checkpw, password.encode('utf-8'),
+                         hashed_password)
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+
+def _add_user_indexes(conn: Connection) -> None:
+    """
+    Index the lookup columns of databases created before they were
+    declared on User
+    """
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email "
+                      "ON users (email)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_session_id "
+                      "ON users (session_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_reset_token "
+                      "ON users (reset_token)"))
+
+
+MIGRATIONS = [
+    (1, _add_user_indexes),
+]
+
+
+def migrate(conn: Connection) -> int:
+    """
+    Apply the migrations newer than the version recorded in the
+    schema_version table, in the transaction of `conn`, and return the
+    resulting version
+    """
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version "
+                      "(version INTEGER PRIMARY KEY)"))
+    version = conn.execute(
+        text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    for number, migration in MIGRATIONS:
+        if number <= version:
+            continue
+        migration(conn)
+        conn.execute(text("INSERT INTO schema_version (version) "
+                          "VALUES (:version)"), {"version": number})
+        version = number
+    return version
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests of the DB_PERSISTENT startup of DB
+"""
+import multiprocessing
+import sqlite3
+
+WORKERS = 6
+
+
+def _start(url: str, barrier, results) -> None:
+    """
+    Open the database at `url` once every worker is ready
+    """
+    import os
+    os.environ["DB_URL"] = url
+    os.environ["DB_PERSISTENT"] = "1"
+    from db import DB
+
+    barrier.wait()
+    try:
+        DB()
+        results.put(None)
+    except Exception as e:
+        results.put(repr(e))
+
+
+def test_concurrent_startup_on_new_database(tmp_path):
+    """
+    Workers starting together on a new database all succeed, and the
+    schema is created and migrated once
+    """
+    path = tmp_path / "a.db"
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(WORKERS)
+    results = context.Queue()
+    workers = [context.Process(target=_start,
+                               args=("sqlite:///{}".format(path),
+                                     barrier, results))
+               for _ in range(WORKERS)]
+    for worker in workers:
+        worker.start()
+    errors = [results.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join()
+    assert errors == [None] * WORKERS
+    with sqlite3.connect(str(path)) as conn:
+        versions = conn.execute("SELECT version FROM schema_version")
+        assert versions.fetchall() == [(1,)]